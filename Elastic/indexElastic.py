@@ -7,16 +7,35 @@ Input Requirment:
 1.	Path of data in JSON
 2.	Name of Elastic Index
 3.	URL of Elastic main node
+4.	Optional: language index of the metadata (RabbitMQ/common/languages.py)
 
 This script will index the JSON data into the given Elastic index 
 """
 
 import os
+import sys
 import json
 import requests
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'RabbitMQ'))
+from common.languages import LanguageIndex, update_language_index
 
-def index_documents(json_files, index_name, es_url):
+
+def add_language(json_data, ppn, languages):
+    """
+    Fill in language.language, which the search filters on, from the language index if the document has none.
+    """
+    field = json_data.get('language')
+    if field and (not isinstance(field, dict) or field.get('language')):
+        return
+    try:
+        language = languages[ppn]
+    except KeyError:
+        return
+    if language:
+        json_data['language'] = dict(field or {}, language=language)
+
+def index_documents(json_files, index_name, es_url, languages=None):
     """
     Index documents into Elasticsearch index.
     """
@@ -30,6 +49,8 @@ def index_documents(json_files, index_name, es_url):
                 error_files.append(json_file)
                 print(f"Error loading {json_file}")
                 continue
+            if languages is not None:
+                add_language(json_data, os.path.splitext(os.path.basename(json_file))[0], languages)
             url = f"{es_url}/{index_name}/_doc"
             response = requests.post(url, data=json.dumps(json_data), headers={"Content-Type": "application/json"})
             if response.status_code != 201:
@@ -51,9 +72,18 @@ def main():
     index_name = ''
     #Elastic Main Node e.g., http://trendtf22.osl.tib.eu:9200
     es_url = ''
+    #Language index and the metadata folder it is updated from, e.g. /mnt/drive/metadata/ExtractedMetaDataJson/ExtractedMetaDataJson/
+    language_index = ''
+    metadata_folder = ''
+
+    languages = None
+    if language_index:
+        if metadata_folder:
+            update_language_index(metadata_folder, language_index)
+        languages = LanguageIndex(language_index)
 
     json_files = [os.path.join(input_folder, f) for f in os.listdir(input_folder) if f.endswith('.json')]
-    index_documents(json_files, index_name, es_url)
+    index_documents(json_files, index_name, es_url, languages)
 
 if __name__ == '__main__':
     main()
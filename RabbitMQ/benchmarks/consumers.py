@@ -0,0 +1,290 @@
+"""
+Offline benchmark of the consumer apps, without RabbitMQ.
+
+Every app is loaded like serve.py loads it and fed through the real BatchConsumer callback
+(on_message) by a fake channel and connection that deliver the messages from an in-process queue,
+respecting the prefetch count, and record when each message is acknowledged. Each app runs in its
+own forked process, so the peak RSS is that of the app alone.
+
+Reported per app: documents per second, p50/p95/p99 latency from delivery to acknowledgement,
+setup time, peak RSS and the functions with the most time in a separate cProfile pass over the
+first PROFILED_DOCUMENTS documents.
+The results are saved as JSON; --compare prints the change against an earlier result file.
+
+Usage:
+python3 consumers.py <app folder> [<app folder> ...] [--corpus folder] [--documents 200] [--words 2000]
+                     [--batch-size N] [--workers N] [--set KEY=VALUE ...] [--output results.json]
+                     [--compare old.json]
+
+Without --corpus the documents are synthetic: random words, for keyphrase apps mixed with the pilots
+of their terminology. --set overrides the prod_config.yml, e.g. --set TERMINOLOGY_FILE=terms.tsv.
+Outputs are written to a temporary folder and the result cache is off unless it is set.
+"""
+
+import argparse
+import cProfile
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import pstats
+import random
+import resource
+import sys
+import tempfile
+import time
+
+import numpy as np
+import yaml
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.consumer import load_app
+from common.messages import encode_task
+from common.runtime import BatchConsumer, create_executor
+
+FILLER = ['the', 'and', 'of', 'measurement', 'results', 'were', 'analysed', 'in', 'this', 'report',
+          'die', 'und', 'der', 'Messung', 'Ergebnisse', 'wurden', 'untersucht', 'Bericht', 'Berlin', 'Hannover']
+
+# Documents of the separate profiling pass, which always runs on this process
+PROFILED_DOCUMENTS = 50
+
+
+class Method:
+    def __init__(self, delivery_tag):
+        self.delivery_tag = delivery_tag
+        self.redelivered = False
+
+
+class Properties:
+    content_encoding = None
+
+
+class FakeConnection:
+    """The parts of a pika BlockingConnection the BatchConsumer uses."""
+
+    def __init__(self):
+        self.timers = []
+        self.callbacks = []
+
+    def call_later(self, delay, callback):
+        timer = [time.monotonic() + delay, callback]
+        self.timers.append(timer)
+        return timer
+
+    def remove_timeout(self, timer):
+        if timer in self.timers:
+            self.timers.remove(timer)
+
+    def add_callback_threadsafe(self, callback):
+        # list.append is atomic, the executor threads may call this
+        self.callbacks.append(callback)
+
+    def process_data_events(self):
+        while self.callbacks:
+            self.callbacks.pop(0)()
+        now = time.monotonic()
+        for timer in [timer for timer in self.timers if timer[0] <= now]:
+            self.timers.remove(timer)
+            timer[1]()
+
+
+class FakeChannel:
+    """Delivers the bodies of an in-process queue and records when every delivery tag is settled."""
+
+    def __init__(self, bodies):
+        self.connection = FakeConnection()
+        self.bodies = list(bodies)
+        self.delivered = {}
+        self.settled = {}
+        self.rejected = 0
+        self.prefetch_count = 1
+        self.on_message = None
+
+    def basic_qos(self, prefetch_count):
+        self.prefetch_count = prefetch_count
+
+    def basic_consume(self, queue, on_message_callback):
+        self.on_message = on_message_callback
+
+    def settle(self, delivery_tag, multiple):
+        now = time.perf_counter()
+        tags = [tag for tag in self.delivered if tag <= delivery_tag] if multiple else [delivery_tag]
+        for tag in tags:
+            self.settled.setdefault(tag, now)
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        self.settle(delivery_tag, multiple)
+
+    def basic_reject(self, delivery_tag, requeue):
+        self.rejected += 1
+        self.settle(delivery_tag, False)
+
+    def stop_consuming(self):
+        self.bodies = []
+
+    def run(self):
+        """Deliver every body and wait until all of them are settled."""
+        delivery_tag = 0
+        while len(self.settled) < delivery_tag or self.bodies:
+            if self.bodies and delivery_tag - len(self.settled) < self.prefetch_count:
+                delivery_tag += 1
+                self.delivered[delivery_tag] = time.perf_counter()
+                self.on_message(self, Method(delivery_tag), Properties(), self.bodies.pop(0))
+                continue
+            self.connection.process_data_events()
+            time.sleep(0.0005)
+        return [self.settled[tag] - self.delivered[tag] for tag in sorted(self.settled)]
+
+
+def load_corpus(folder, documents):
+    names = sorted(name for name in os.listdir(folder) if not name.startswith('.'))
+    random.Random(123).shuffle(names)
+    corpus = []
+    for name in names[:documents]:
+        with open(os.path.join(folder, name), encoding='utf-8', errors='replace') as f:
+            corpus.append((name, f.read()))
+    return corpus
+
+
+def synthetic_corpus(documents, words, vocabulary, seed=123):
+    rng = random.Random(seed)
+    return [('synthetic{:05d}.txt'.format(i), ' '.join(rng.choice(vocabulary) for _ in range(words)))
+            for i in range(documents)]
+
+
+def top_functions(profile, count=25):
+    stats = pstats.Stats(profile).stats
+    rows = sorted(stats.items(), key=lambda item: item[1][2], reverse=True)[:count]
+    return [{'function': '{}:{}({})'.format(os.path.basename(filename), line, name), 'calls': calls,
+             'tottime': round(tottime, 6), 'cumtime': round(cumtime, 6)}
+            for (filename, line, name), (_, calls, tottime, cumtime, _) in rows]
+
+
+def deliver(task, bodies, executor, prefetch_count):
+    """Consume the bodies with a BatchConsumer, returns the latency of every message and the number rejected."""
+    channel = FakeChannel(bodies)
+    BatchConsumer(channel, task.queue_name, task, task.batch_size, executor, batch_timeout=0,
+                  prefetch_count=prefetch_count).start()
+    return channel.run(), channel.rejected
+
+
+def benchmark_app(app_folder, args, overrides):
+    """Run one app, in its own process."""
+    output_folder = tempfile.mkdtemp(prefix='benchmark-')
+    overrides = dict({'OUTPUT_FOLDER': output_folder + '/', 'RESULT_CACHE': None, 'METRICS_PORT': None}, **overrides)
+    if args.batch_size:
+        overrides['BATCH_SIZE'] = args.batch_size
+
+    start = time.perf_counter()
+    task = load_app(app_folder, overrides=overrides)
+    task.setup()
+    task.setup_cache()
+    setup_seconds = time.perf_counter() - start
+
+    if args.corpus:
+        corpus = load_corpus(args.corpus, args.documents)
+    else:
+        vocabulary = list(FILLER)
+        if hasattr(task, 'terminology'):
+            pilots = [task.terminology.prepilot(i) for i in range(len(task.terminology))]
+            vocabulary += random.Random(123).sample(pilots, min(len(pilots), 5 * len(FILLER)))
+        corpus = synthetic_corpus(args.documents, args.words, vocabulary)
+    bodies = [encode_task(filename, contents) for filename, contents in corpus]
+
+    executor = create_executor({task.queue_name: (task, '')}, args.workers) if args.workers > 1 else None
+    start = time.perf_counter()
+    latencies, rejected = deliver(task, bodies, executor, 2 * args.workers * task.batch_size)
+    seconds = time.perf_counter() - start
+    if executor is not None:
+        executor.shutdown()
+
+    # The profiler slows the consumer down, so it gets a pass of its own over the first documents
+    profile = cProfile.Profile()
+    profile.enable()
+    deliver(task, bodies[:PROFILED_DOCUMENTS], None, task.batch_size)
+    profile.disable()
+
+    latencies = np.array(latencies)
+    # ru_maxrss is in KiB on Linux
+    peak_rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                   resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) * 1024
+    return {
+        'documents': len(bodies),
+        'characters': sum(len(contents) for _, contents in corpus),
+        'batch_size': task.batch_size,
+        'workers': args.workers,
+        'setup_seconds': round(setup_seconds, 3),
+        'seconds': round(seconds, 3),
+        'documents_per_second': round(len(bodies) / seconds, 3),
+        'latency_p50': round(float(np.percentile(latencies, 50)), 6),
+        'latency_p95': round(float(np.percentile(latencies, 95)), 6),
+        'latency_p99': round(float(np.percentile(latencies, 99)), 6),
+        'rejected': rejected,
+        'peak_rss_bytes': peak_rss,
+        'profile': top_functions(profile),
+    }
+
+
+def run_in_process(app_folder, args, overrides, results):
+    try:
+        results.put(benchmark_app(app_folder, args, overrides))
+    except Exception as e:
+        results.put({'error': repr(e)})
+        raise
+
+
+def compare(results, previous_file):
+    with open(previous_file) as f:
+        previous = json.load(f)['results']
+    for app, result in results.items():
+        old = previous.get(app)
+        if not old or 'error' in old or 'error' in result:
+            continue
+        print('{}: {:.2f} -> {:.2f} documents/s ({:+.1f}%), p95 {:.4f}s -> {:.4f}s'.format(
+            app, old['documents_per_second'], result['documents_per_second'],
+            100 * (result['documents_per_second'] / old['documents_per_second'] - 1),
+            old['latency_p95'], result['latency_p95']))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('apps', nargs='+', help='app folders with a consumer.py and a prod_config.yml')
+    parser.add_argument('--corpus', help='folder of sample documents, synthetic documents without it')
+    parser.add_argument('--documents', type=int, default=200)
+    parser.add_argument('--words', type=int, default=2000, help='words per synthetic document')
+    parser.add_argument('--batch-size', type=int, help='overrides BATCH_SIZE')
+    parser.add_argument('--workers', type=int, default=1, help='forked workers of the timed run')
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE',
+                        help='overrides a setting of the prod_config.yml, the value is parsed as YAML')
+    parser.add_argument('--output', default='consumers-{}.json'.format(datetime.datetime.now().strftime('%Y%m%d-%H%M%S')))
+    parser.add_argument('--compare', help='earlier result file')
+    args = parser.parse_args()
+    overrides = {key: yaml.safe_load(value) for key, value in (item.split('=', 1) for item in args.set)}
+
+    results = {}
+    context = multiprocessing.get_context('fork')
+    for app_folder in args.apps:
+        app = os.path.basename(os.path.normpath(app_folder))
+        queue = context.Queue()
+        process = context.Process(target=run_in_process, args=(os.path.abspath(app_folder), args, overrides, queue))
+        process.start()
+        results[app] = queue.get()
+        process.join()
+        if 'error' in results[app]:
+            print('{}: failed with {}'.format(app, results[app]['error']))
+            continue
+        print('{}: {documents_per_second:.2f} documents/s, latency p50 {latency_p50:.4f}s p95 {latency_p95:.4f}s '
+              'p99 {latency_p99:.4f}s, setup {setup_seconds:.1f}s, peak RSS {rss:.0f} MiB'.format(
+                  app, rss=results[app]['peak_rss_bytes'] / 2 ** 20, **results[app]))
+
+    with open(args.output, 'w') as f:
+        json.dump({'started': datetime.datetime.now().isoformat(timespec='seconds'), 'host': platform.node(),
+                   'python': platform.python_version(), 'arguments': vars(args), 'results': results}, f, indent=2)
+    print('Results saved to {}'.format(args.output))
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark of the pilot counting step of the keyphrase consumers.
+
+Compares the per pilot re.findall loop the consumers used before with the single pass
+TerminologyMatcher and checks that both count exactly the same.
+
+Usage:
+python3 keyphrase_matcher.py <terminology.tsv> [document.txt ...]
+
+Without documents a synthetic document is generated from the pilots of the terminology.
+"""
+
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.terminology import TerminologyMatcher, load_terminology, load_terminology_index
+
+
+def count_with_regex(content, terminology):
+    """The counting loop of extract_keyphrases before the TerminologyMatcher, in terminology order."""
+    tf = []
+    for pilot in terminology:
+        pattern = r'\b{}\b'.format(re.escape(terminology[pilot]['prepilot']))
+        tf.append(len(re.findall(pattern, content)))
+    return tf
+
+
+def synthetic_document(terminology, words=50000, seed=123):
+    """Mix pilots with filler words and punctuation so that boundaries matter."""
+    rng = random.Random(seed)
+    pilots = [terminology[pilot]['prepilot'] for pilot in terminology]
+    filler = ['the', 'and', 'of', 'measurement', 'results', 'were', 'analysed', 'in', 'this', 'report']
+    parts = []
+    for _ in range(words):
+        parts.append(rng.choice(pilots) if rng.random() < 0.2 else rng.choice(filler))
+        if rng.random() < 0.1:
+            parts.append(rng.choice(['.', ',', '-', '(', ')']))
+    return ' '.join(parts)
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    start = time.perf_counter()
+    terminology = load_terminology(sys.argv[1])
+    matcher = TerminologyMatcher.build([terminology[pilot]['prepilot'] for pilot in terminology])
+    print('Pilots: {}, TSV load and matcher build: {:.3f}s'.format(len(terminology), time.perf_counter() - start))
+
+    index_file = os.path.join(tempfile.mkdtemp(), 'terminology.idx')
+    load_terminology_index(sys.argv[1], 10000, index_file)
+    start = time.perf_counter()
+    index = load_terminology_index(sys.argv[1], 10000, index_file)
+    print('Index load (hash check and mmap): {:.3f}s'.format(time.perf_counter() - start))
+
+    documents = []
+    for path in sys.argv[2:]:
+        with open(path, encoding='utf-8', errors='replace') as f:
+            documents.append((path, f.read().lower()))
+    if not documents:
+        documents.append(('synthetic', synthetic_document(terminology).lower()))
+
+    for name, content in documents:
+        start = time.perf_counter()
+        expected = count_with_regex(content, terminology)
+        regex_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        counted = matcher.count(content)
+        matcher_time = time.perf_counter() - start
+
+        assert counted == expected, 'Counts differ for {}'.format(name)
+        assert index.matcher.count(content) == expected, 'Index counts differ for {}'.format(name)
+        print('{} ({} chars): regex loop {:.3f}s, matcher {:.3f}s, speedup {:.1f}x'.format(
+            name, len(content), regex_time, matcher_time, regex_time / matcher_time))
+
+
+if __name__ == '__main__':
+    main()
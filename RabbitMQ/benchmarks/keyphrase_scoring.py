@@ -0,0 +1,67 @@
+"""
+Benchmark of the TF-IDF scoring and top-k step of the keyphrase consumers.
+
+Compares the dict based scoring with a full sort the consumers used before with the NumPy
+scoring over the terminology index arrays and top_k, and checks that both select the same
+pilots in the same order.
+
+Usage:
+python3 keyphrase_scoring.py [number_of_pilots] [number_of_candidates] [max_keyphrases]
+
+The terminology and the term frequencies are synthetic; by default 50000 pilots of which
+12000 occur in the document.
+"""
+
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.terminology import top_k
+
+
+def score_with_dicts(tf, terminology, max_keyphrases, number_of_documents_in_corpus):
+    """The scoring of extract_keyphrases before the NumPy arrays."""
+    idf = {pilot: math.log(number_of_documents_in_corpus / terminology[pilot]['freq']) for pilot in tf}
+    tfidf = {pilot: (tf[pilot] / len(tf)) * idf[pilot] * terminology[pilot]['spec'] for pilot in tf}
+    sorted_pilots = sorted(tfidf, key=tfidf.get, reverse=True)
+    return sorted_pilots[:max_keyphrases]
+
+
+def main():
+    number_of_pilots = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    number_of_candidates = int(sys.argv[2]) if len(sys.argv) > 2 else 12000
+    max_keyphrases = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+    number_of_documents_in_corpus = 10306
+
+    rng = np.random.default_rng(123)
+    freq = rng.integers(1, 3 * number_of_documents_in_corpus, size=number_of_pilots)
+    spec = np.round(rng.uniform(0.5, 5.0, size=number_of_pilots), 2)
+    counts = np.zeros(number_of_pilots, dtype=np.int64)
+    candidates = rng.choice(number_of_pilots, size=number_of_candidates, replace=False)
+    counts[candidates] = rng.zipf(2.0, size=number_of_candidates).clip(max=500)
+
+    pilots = ['pilot{}'.format(i) for i in range(number_of_pilots)]
+    terminology = {pilot: {'freq': int(freq[i]), 'spec': float(spec[i])} for i, pilot in enumerate(pilots)}
+    tf = {pilot: int(counts[i]) for i, pilot in enumerate(pilots)}
+    idf = np.array([math.log(number_of_documents_in_corpus / f) for f in freq.tolist()])
+
+    start = time.perf_counter()
+    expected = score_with_dicts(tf, terminology, max_keyphrases, number_of_documents_in_corpus)
+    dict_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    tfidf = (counts / len(counts)) * idf * spec
+    selected = top_k(tfidf, max_keyphrases)
+    numpy_time = time.perf_counter() - start
+
+    assert [pilots[i] for i in selected] == expected, 'Rankings differ'
+    print('{} pilots, {} candidates, top {}: dicts and sort {:.4f}s, numpy and top_k {:.4f}s, speedup {:.1f}x'.format(
+        number_of_pilots, number_of_candidates, max_keyphrases, dict_time, numpy_time, dict_time / numpy_time))
+
+
+if __name__ == '__main__':
+    main()
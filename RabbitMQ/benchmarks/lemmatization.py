@@ -0,0 +1,116 @@
+"""
+Benchmark of the lemmatization of the lemma_corpus consumer.
+
+Compares the per-word lemmatization the consumer used before (one spaCy Doc per word of
+word_tokenize, full model) with the Lemmatizer of common.lemmas (pre-tokenized chunks through
+nlp.pipe, without parser and NER) on the same documents, and reports words per second and how
+many of the output lemmas agree. They need not agree everywhere: in context the tagger finds
+other POS tags and lemmas than for a lone word, and spaCy splits some lone words (e.g. "report.")
+of which the per-word function only kept the first token.
+
+Usage:
+python3 lemmatization.py [--model en_core_web_sm] [--corpus folder] [--documents 20] [--words 2000]
+                         [--chunk-words 5000] [--batch-size 32] [--processes 1]
+                         [--stop-words-de file] [--stop-words-en file]
+
+Without --corpus the documents are synthetic sentences. --model may also be the path of a
+saved pipeline. The stopwords are only the given files, NLTK's lists are not downloaded.
+"""
+
+import argparse
+import difflib
+import os
+import random
+import sys
+import time
+
+import spacy
+from nltk.tokenize import word_tokenize
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.lemmas import Lemmatizer, load_model
+from common.stopwords import load_stopwords
+
+SENTENCES = ['The results of the measurements were analysed in this report.',
+             'Engineers in Hannover tested the new turbine blades under load.',
+             'The model predicts the wear of the bearings after several thousand hours.',
+             'Die Ergebnisse der Messungen wurden in diesem Bericht untersucht.',
+             'Several samples showed cracks that were not visible before.']
+
+
+def lemmatize_per_word(nlp, words, stop_words_de, stop_words_en):
+    """The lemmatization of the lemma_corpus consumer before the whole-document pipeline."""
+    lemmatized_words = []
+    for word in words:
+        doc = nlp(word)
+        # Ignore proper nouns (PROPN)
+        if doc[0].pos_ != "PROPN":
+            # Check if the word is not a stopword in both STOP_WORDS_DE and STOP_WORDS_EN
+            if word.lower() not in stop_words_de and word.lower() not in stop_words_en:
+                lemmatized_words.append(doc[0].lemma_)
+    return " ".join(lemmatized_words)
+
+
+def load_documents(args):
+    if args.corpus:
+        names = sorted(name for name in os.listdir(args.corpus) if not name.startswith('.'))[:args.documents]
+        documents = []
+        for name in names:
+            with open(os.path.join(args.corpus, name), encoding='utf-8', errors='replace') as f:
+                documents.append(f.read())
+        return documents
+    rng = random.Random(123)
+    documents = []
+    for _ in range(args.documents):
+        sentences = []
+        while sum(len(sentence.split()) for sentence in sentences) < args.words:
+            sentences.append(rng.choice(SENTENCES))
+        documents.append(' '.join(sentences))
+    return documents
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', default='en_core_web_sm', help='spaCy model name or path')
+    parser.add_argument('--corpus', help='folder of sample documents, synthetic documents without it')
+    parser.add_argument('--documents', type=int, default=20)
+    parser.add_argument('--words', type=int, default=2000, help='words per synthetic document')
+    parser.add_argument('--chunk-words', type=int, default=5000)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--stop-words-de')
+    parser.add_argument('--stop-words-en')
+    args = parser.parse_args()
+
+    stop_words_de = load_stopwords([], args.stop_words_de) if args.stop_words_de else set()
+    stop_words_en = load_stopwords([], args.stop_words_en) if args.stop_words_en else set()
+    word_lists = [word_tokenize(document) for document in load_documents(args)]
+    number_of_words = sum(len(words) for words in word_lists)
+
+    nlp = spacy.load(args.model)
+    start = time.perf_counter()
+    expected = [lemmatize_per_word(nlp, words, stop_words_de, stop_words_en) for words in word_lists]
+    per_word_time = time.perf_counter() - start
+
+    lemmatizer = Lemmatizer(load_model(args.model), stop_words_de, stop_words_en,
+                            args.chunk_words, args.batch_size, args.processes)
+    start = time.perf_counter()
+    lemmatized = lemmatizer.lemmatize_words(word_lists)
+    pipeline_time = time.perf_counter() - start
+
+    matcher = difflib.SequenceMatcher(autojunk=False)
+    matching = total = 0
+    for old, new in zip(expected, lemmatized):
+        matcher.set_seqs(old.split(), new.split())
+        matching += sum(block.size for block in matcher.get_matching_blocks())
+        total += max(len(old.split()), len(new.split()))
+
+    print('{} documents, {} words: per word {:.2f}s ({:.0f} words/s), whole-document pipeline {:.2f}s '
+          '({:.0f} words/s), speedup {:.1f}x, {:.1%} of the lemmas agree'.format(
+              len(word_lists), number_of_words, per_word_time, number_of_words / per_word_time,
+              pipeline_time, number_of_words / pipeline_time, per_word_time / pipeline_time,
+              matching / total if total else 1.0))
+
+
+if __name__ == '__main__':
+    main()
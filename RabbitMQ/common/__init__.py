@@ -0,0 +1,6 @@
+"""
+Code shared by the RabbitMQ consumers.
+
+The consumers are deployed next to each other under /mnt/drive/RabbitMQ/, so every
+consumer.py adds its parent folder to sys.path and imports from this package.
+"""
@@ -0,0 +1,185 @@
+"""
+Result cache of the RabbitMQ consumers.
+
+The outputs of the keyphrase, lemma and dictionary-filter tasks only depend on the document and
+on the version of the task: its name, the config that affects the output and the data it loaded
+(terminology, models, word lists). With RESULT_CACHE in the prod_config.yml the consumer keeps
+the output of every document in a SQLite file under
+
+sha256(task version, document)
+
+and serves redelivered messages and reruns of an unchanged corpus from it without processing
+them again. A new terminology or model changes the task version, so stale outputs are never used.
+
+The cache belongs on a local disk, SQLite must not be shared over /mnt/drive; every process
+(including the forked workers) opens its own connection.
+
+TokenCache caches values per word instead of per document, e.g. the lemmas of the lemma_corpus
+app: most words of a corpus are frequent ones, which only have to be analysed once.
+"""
+
+import collections
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import zlib
+
+
+def cache_key(version, document):
+    """Key of a document for a task version, both Strings."""
+    sha256 = hashlib.sha256(version.encode('utf-8'))
+    sha256.update(b'\0')
+    sha256.update(document.encode('utf-8', 'surrogatepass'))
+    return sha256.hexdigest()
+
+
+class ResultCache:
+    """Outputs by cache_key, zlib compressed in a SQLite table."""
+
+    def __init__(self, path):
+        self.path = path
+        self.pid = None
+        self.connection = None
+
+    def connect(self):
+        # A connection must not be used across a fork, every process opens its own
+        self.pid = os.getpid()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, output BLOB NOT NULL)')
+
+    def get_many(self, keys):
+        """Return the cached output of every key, None where there is none."""
+        if self.pid != os.getpid():
+            self.connect()
+        found = {}
+        # Stay below the SQLite limit of host parameters
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = self.connection.execute('SELECT key, output FROM results WHERE key IN ({})'.format(
+                ','.join('?' * len(chunk))), chunk)
+            found.update((key, zlib.decompress(output).decode('utf-8', 'surrogatepass')) for key, output in rows)
+        return [found.get(key) for key in keys]
+
+    def put_many(self, items):
+        """Store (key, output) pairs in one transaction."""
+        if self.pid != os.getpid():
+            self.connect()
+        with self.connection:
+            self.connection.execute('BEGIN')
+            self.connection.executemany('INSERT OR REPLACE INTO results (key, output) VALUES (?, ?)',
+                                        ((key, zlib.compress(output.encode('utf-8', 'surrogatepass')))
+                                         for key, output in items))
+
+
+class TokenCache:
+    """
+    Two-level cache of per-token values, e.g. the lemma and POS tag of a word: an LRU dict of at
+    most size entries in the process and, with a path, a SQLite store shared by the processes and
+    runs that holds at most disk_size entries; the least recently used are evicted.
+
+    Keys are (namespace, token), the namespace names everything the value depends on besides the
+    token (language, model and version). Values are anything JSON can store, lists come back as lists.
+    """
+
+    def __init__(self, size=100000, path=None, disk_size=1000000):
+        self.size = size
+        self.path = path
+        self.disk_size = disk_size
+        self.entries = collections.OrderedDict()
+        # Tokens found on disk, their use is recorded with the next put_many
+        self.used_on_disk = []
+        self.inserted = 0
+        self.lookups = collections.Counter()
+        self.pid = None
+        self.connection = None
+
+    def connect(self):
+        self.pid = os.getpid()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS tokens (namespace TEXT NOT NULL, token TEXT NOT NULL, '
+                                'value TEXT NOT NULL, used REAL NOT NULL, PRIMARY KEY (namespace, token))')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS tokens_used ON tokens (used)')
+        self.used_on_disk = []
+
+    def get_many(self, namespace, tokens):
+        """Return a dict of the tokens that are cached and their values, counts hits in memory and on disk."""
+        found = {}
+        missing = []
+        for token in tokens:
+            key = (namespace, token)
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                found[token] = self.entries[key]
+            else:
+                missing.append(token)
+        self.lookups['memory'] += len(found)
+
+        if missing and self.path:
+            if self.pid != os.getpid():
+                self.connect()
+            on_disk = {}
+            # Stay below the SQLite limit of host parameters
+            for start in range(0, len(missing), 500):
+                chunk = missing[start:start + 500]
+                rows = self.connection.execute(
+                    'SELECT token, value FROM tokens WHERE namespace = ? AND token IN ({})'.format(
+                        ','.join('?' * len(chunk))), [namespace] + chunk)
+                on_disk.update((token, json.loads(value)) for token, value in rows)
+            self.remember(namespace, on_disk.items())
+            self.used_on_disk.extend((namespace, token) for token in on_disk)
+            found.update(on_disk)
+            self.lookups['disk'] += len(on_disk)
+        self.lookups['miss'] += len(tokens) - len(found)
+        return found
+
+    def remember(self, namespace, items):
+        for token, value in items:
+            self.entries[(namespace, token)] = value
+            self.entries.move_to_end((namespace, token))
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def put_many(self, namespace, items):
+        """Cache (token, value) pairs, on disk in one transaction."""
+        items = list(items)
+        self.remember(namespace, items)
+        if not self.path:
+            return
+        if self.pid != os.getpid():
+            self.connect()
+        now = time.time()
+        with self.connection:
+            self.connection.execute('BEGIN')
+            self.connection.executemany('INSERT OR REPLACE INTO tokens (namespace, token, value, used) '
+                                        'VALUES (?, ?, ?, ?)',
+                                        ((namespace, token, json.dumps(value), now) for token, value in items))
+            self.connection.executemany('UPDATE tokens SET used = ? WHERE namespace = ? AND token = ?',
+                                        ((now,) + key for key in self.used_on_disk))
+        self.used_on_disk = []
+        self.inserted += len(items)
+        # Counting the table is not free, it is checked after every tenth of the bound was inserted
+        if self.inserted >= self.disk_size // 10:
+            self.inserted = 0
+            self.evict()
+
+    def evict(self):
+        """Delete the least recently used entries on disk above disk_size."""
+        count = self.connection.execute('SELECT COUNT(*) FROM tokens').fetchone()[0]
+        if count > self.disk_size:
+            with self.connection:
+                self.connection.execute('BEGIN')
+                self.connection.execute('DELETE FROM tokens WHERE rowid IN '
+                                        '(SELECT rowid FROM tokens ORDER BY used LIMIT ?)', (count - self.disk_size,))
+
+    def take_lookups(self):
+        """Return the hits (memory, disk) and misses since the last call."""
+        lookups, self.lookups = dict(self.lookups), collections.Counter()
+        return lookups
@@ -0,0 +1,298 @@
+"""
+Consumer runtime shared by the RabbitMQ apps.
+
+An app (lemma_corpus, removeDictionaryWordsCorpus, the keyphrase apps) only implements a
+ConsumerTask: setup loads its models and data once, process or process_batch turns decoded
+tasks into the texts of their output files. Everything else is done here: reading the
+prod_config.yml, connecting to RabbitMQ and reconnecting when the connection is lost,
+batching and the worker pool (common.runtime) and the metrics of every queue, logged and with
+METRICS_PORT served to Prometheus (common.metrics).
+
+Run one app:
+python3 consumer.py [--workers N] [--config prod_config.yml]
+
+Serve the queues of several apps from one process, sharing one worker pool and the models
+their tasks loaded:
+python3 serve.py [--workers N] <app folder> [<app folder> ...]
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import signal
+import time
+
+import pika
+import yaml
+
+from common.cache import ResultCache, cache_key
+from common.metrics import ConsumerMetrics, start_metrics_server
+from common.runtime import BatchConsumer, create_executor
+from common.sinks import OutputError, create_sink
+
+# Settings that have to be the same for all queues served by one process
+CONNECTION_KEYS = ('RABBITMQ_HOST', 'RABBITMQ_PORT', 'RABBITMQ_USER', 'RABBITMQ_PASS', 'HEARTBEAT')
+
+# Settings that do not change the outputs of a task, left out of its result version
+RUNTIME_KEYS = CONNECTION_KEYS + ('QUEUE_NAME', 'BATCH_SIZE', 'BATCH_TIMEOUT', 'INPUT_FOLDER', 'OUTPUT_FOLDER',
+                                  'RECONNECT_DELAY', 'METRICS_PORT', 'METRICS_INTERVAL', 'OUTPUT_SINK',
+                                  'OUTPUT_WRITERS', 'OUTPUT_BUFFER', 'SHARD_SIZE', 'RESULT_CACHE', 'TERMINOLOGY_INDEX',
+                                  # Producer settings, see common.producer
+                                  'SENT_FILE_LIST', 'PUBLISH_WINDOW', 'MAX_QUEUE_DEPTH', 'QUEUE_CHECK_INTERVAL',
+                                  'CLAIM_CHECK', 'COMPRESSION', 'COMPRESS_THRESHOLD', 'READ_AHEAD',
+                                  'READ_AHEAD_BYTES', 'PUBLISH_WINDOW_BYTES',
+                                  # Parallelism of the lemma pipeline, see common.lemmas
+                                  'SPACY_BATCH_SIZE', 'SPACY_PROCESSES', 'LEMMA_CACHE_SIZE', 'LEMMA_CACHE_FILE',
+                                  'LEMMA_CACHE_FILE_SIZE', 'LANGUAGE_INDEX', 'WORD_CACHE_SIZE', 'WORD_CACHE_FILE',
+                                  'WORD_CACHE_FILE_SIZE', 'SPELL_INDEX', 'CORPUS_STATS')
+
+
+def load_config(filename):
+    try:
+        with open(filename, 'r') as file:
+            config = yaml.safe_load(file)
+    except FileNotFoundError:
+        print(f"Could not find {filename}.")
+        return {}
+
+    return config or {}
+
+
+class ConsumerTask:
+    """
+    Base class of the task plugins.
+
+    setup runs once in the parent process before the workers are forked, everything it loads is
+    shared with them. process_batch runs in the workers and returns the text of the output file
+    of every task; the default processes the tasks one by one with process.
+
+    With RESULT_CACHE the outputs are cached under result_version and cache_document
+    (common.cache), documents found there are written without being processed.
+    """
+
+    # Encoding of the output files, None keeps the locale encoding the consumers always wrote with
+    output_encoding = None
+
+    def __init__(self, config):
+        """
+        Parameters:
+        config (Dict): prod_config.yml of the app
+        """
+        self.config = config
+        self.queue_name = config.get('QUEUE_NAME')
+        self.batch_size = config.get('BATCH_SIZE') or 1
+        self.input_folder = config.get('INPUT_FOLDER', '')
+        self.output_folder = config.get('OUTPUT_FOLDER', '')
+        self.sink = create_sink(config, self.output_folder, self.output_encoding)
+        self.cache = None
+
+    def setup(self):
+        """Load models and data."""
+
+    def setup_cache(self):
+        """Open the RESULT_CACHE, after setup so that result_version can include the loaded data."""
+        if self.config.get('RESULT_CACHE'):
+            self.cache = ResultCache(self.config['RESULT_CACHE'])
+            self.version = self.result_version()
+
+    def result_version(self):
+        """
+        Everything besides the document the outputs depend on: the task and its config. Tasks
+        extend it by the versions of the data and models they loaded.
+        """
+        config = {key: value for key, value in self.config.items() if key not in RUNTIME_KEYS}
+        return '{} {}'.format(type(self).__name__, json.dumps(config, sort_keys=True, default=str))
+
+    def cache_document(self, task):
+        """The part of a task its output depends on, override if that is more than the contents."""
+        return task['contents']
+
+    def cache_lookups(self):
+        """Lookups in the caches of the task since the last call, as {(cache, result): count}, for the metrics."""
+        return {}
+
+    def process(self, task):
+        """
+        Process one decoded task.
+
+        Parameters:
+        task (Dict): 'filename' and 'contents' of the document
+
+        Returns:
+        String: the text of the output file
+        """
+        raise NotImplementedError
+
+    def process_batch(self, tasks):
+        """Process a batch of decoded tasks, override to process the documents together."""
+        return [self.process(task) for task in tasks]
+
+    def write(self, filename, output):
+        """Save the output of a document under the document's filename, see common.sinks."""
+        self.sink.write(filename, output)
+
+    def __call__(self, tasks):
+        """Process and write a batch, returns the seconds spent in both stages and the cache hits for the metrics."""
+        for task in tasks:
+            print(f"Received task {task['filename']} from distributor")
+
+        start = time.perf_counter()
+        outputs = [None] * len(tasks)
+        if self.cache is not None:
+            keys = [cache_key(self.version, self.cache_document(task)) for task in tasks]
+            outputs = self.cache.get_many(keys)
+        misses = [i for i, output in enumerate(outputs) if output is None]
+        if misses:
+            for i, output in zip(misses, self.process_batch([tasks[i] for i in misses])):
+                outputs[i] = output
+        processed = time.perf_counter()
+        try:
+            for task, output in zip(tasks, outputs):
+                self.write(task['filename'], output)
+            # The batch is acknowledged when this returns, so its outputs have to be written by then
+            self.sink.flush()
+        except OSError as e:
+            raise OutputError('Could not write the outputs of the batch: {!r}'.format(e)) from e
+        if self.cache is not None and misses:
+            self.cache.put_many((keys[i], outputs[i]) for i in misses)
+        stages = {'process': processed - start, 'write': time.perf_counter() - processed}
+        if self.cache is not None:
+            stages.update(cache_hits=len(tasks) - len(misses), cache_misses=len(misses))
+        stages['lookups'] = self.cache_lookups()
+        return stages
+
+
+def load_app(app_folder, yaml_config=None, overrides=None):
+    """
+    Import the consumer.py of an app folder and create its task.
+
+    Parameters:
+    app_folder (String): folder with the consumer.py, which defines TASK, the ConsumerTask class of the app
+    yaml_config (String): config file, defaults to the prod_config.yml of the app folder
+    overrides (Dict): settings replacing those of the config file
+
+    Returns:
+    ConsumerTask: the task, not yet set up
+    """
+    yaml_config = yaml_config or os.path.join(app_folder, 'prod_config.yml')
+    config = load_config(yaml_config)
+    if not config:
+        raise ValueError('Empty configuration {}'.format(yaml_config))
+    config.update(overrides or {})
+    # All apps name their script consumer.py, give every one its own module name
+    module_name = '{}_consumer'.format(os.path.basename(os.path.normpath(app_folder)))
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(app_folder, 'consumer.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.TASK(config)
+
+
+def connect_parameters(config):
+    credentials = pika.PlainCredentials(config.get('RABBITMQ_USER'), config.get('RABBITMQ_PASS'))
+    return pika.ConnectionParameters(host=config.get('RABBITMQ_HOST'), port=config.get('RABBITMQ_PORT'),
+                                     credentials=credentials, heartbeat=config.get('HEARTBEAT', 10))
+
+
+def connect(config):
+    # Establish connection to RabbitMQ server
+    return pika.BlockingConnection(connect_parameters(config))
+
+
+def exit_on_signal(signum, frame):
+    # Exiting normally runs the atexit handlers and multiprocessing finalizers, e.g. of common.sinks.DiagnosticsLog
+    raise SystemExit(128 + signum)
+
+
+def serve(tasks, workers=1):
+    """
+    Consume the queues of the tasks until the worker pool breaks, then exit with status 1 so
+    that the failure is noticed and the consumer restarted.
+
+    The tasks are set up once, then share one worker pool. When the connection or a channel is
+    lost the process reconnects after RECONNECT_DELAY seconds and keeps its workers and models;
+    the broker redelivers the messages that were not acknowledged. The metrics endpoint uses the
+    METRICS_PORT of the first task.
+
+    Parameters:
+    tasks (List): ConsumerTask of every queue, all on the same RabbitMQ server
+    workers (Int): number of forked worker processes, 1 processes the batches on a thread of this process
+    """
+    config = tasks[0].config
+    for task in tasks[1:]:
+        if any(task.config.get(key) != config.get(key) for key in CONNECTION_KEYS):
+            raise ValueError('Queue {} is not on the RabbitMQ server of {}'.format(task.queue_name, tasks[0].queue_name))
+    if len({task.queue_name for task in tasks}) != len(tasks):
+        raise ValueError('A queue can only be served once per process')
+
+    # screen -X quit (Ansible/stopConsumer.yml) sends SIGHUP; the forked workers inherit the handlers
+    for signum in (signal.SIGHUP, signal.SIGTERM):
+        signal.signal(signum, exit_on_signal)
+
+    for task in tasks:
+        task.setup()
+        task.setup_cache()
+
+    executor = create_executor({task.queue_name: (task, task.input_folder) for task in tasks}, workers)
+    if config.get('METRICS_PORT'):
+        start_metrics_server(config['METRICS_PORT'])
+    metrics = {task.queue_name: ConsumerMetrics(task.queue_name) for task in tasks}
+    reconnect_delay = config.get('RECONNECT_DELAY', 5)
+    metrics_interval = config.get('METRICS_INTERVAL', 60)
+    try:
+        while True:
+            try:
+                connection = connect(config)
+                consumers = []
+                for task in tasks:
+                    channel = connection.channel()
+                    # Create a queue for receiving tasks from distributor
+                    channel.queue_declare(queue=task.queue_name, durable=True)
+                    # One batch in every worker and one more waiting for each
+                    consumer = BatchConsumer(channel, task.queue_name, task, task.batch_size, executor,
+                                             config.get('BATCH_TIMEOUT', 1.0), 2 * workers * task.batch_size,
+                                             task.input_folder, metrics[task.queue_name])
+                    consumer.start()
+                    consumers.append(consumer)
+                    print(f'Waiting for tasks of {task.queue_name} in batches of {task.batch_size} with {workers} worker(s)...')
+
+                def log_metrics(connection=connection):
+                    for queue_metrics in metrics.values():
+                        print(queue_metrics.summary())
+                    connection.call_later(metrics_interval, log_metrics)
+                connection.call_later(metrics_interval, log_metrics)
+
+                while not any(consumer.broken for consumer in consumers):
+                    connection.process_data_events(time_limit=1)
+                connection.close()
+                raise SystemExit(1)
+            except pika.exceptions.AMQPConnectionError as e:
+                print(f'Connection to RabbitMQ lost ({e!r}), reconnecting in {reconnect_delay}s')
+                time.sleep(reconnect_delay)
+            except pika.exceptions.AMQPChannelError as e:
+                # The broker closed a channel (e.g. a failed declare or ack), its consumer cannot go on
+                print(f'Channel to RabbitMQ closed ({e!r}), reconnecting in {reconnect_delay}s')
+                if connection.is_open:
+                    connection.close()
+                time.sleep(reconnect_delay)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def main(task_class, yaml_config):
+    """
+    Command line of the consumer.py of an app.
+
+    Parameters:
+    task_class (Class): ConsumerTask of the app
+    yaml_config (String): default config file
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of worker processes sharing the loaded terminology and models')
+    parser.add_argument('--config', default=yaml_config, help='prod_config.yml of the app')
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    if config:
+        serve([task_class(config)], args.workers)
@@ -0,0 +1,185 @@
+"""
+Document frequencies of the words of a corpus folder: the number of documents N and for every
+word the number of documents it occurs in, for IDF = log(N / df).
+
+The topic modelling (TopicModel/Embeddings+LDA, lda/corpus_stats in its Config.yaml) used to
+tokenize the whole corpus on every run to compute its IDF, and the keyphrase apps hard-code N
+next to their terminology (NUMBER_OF_DOCUMENTS_IN_CORPUS). Both load it from this SQLite file
+instead (CORPUS_STATS in the prod_config.yml of the keyphrase apps).
+
+update_corpus_stats tokenizes the new and changed files of the folder in a process pool, each
+worker returns the distinct words of its documents, and the parent merges them into the
+document frequencies. Like the language index the file records the mtime and size of every
+document, and also its words (compressed), so that changed and removed documents are subtracted
+again and the update can run at every start. The file records the version of the tokenization
+and is rebuilt when it changes.
+
+Usage:
+python3 corpusstats.py <document folder> <stats file> [--workers N]
+"""
+
+import argparse
+import collections
+import math
+import multiprocessing
+import os
+import sqlite3
+import time
+import zlib
+
+import nltk
+from nltk.tokenize import word_tokenize
+
+STATS_VERSION = 1
+
+
+def document_words(text):
+    """Words of a document as the topic modelling preprocessing tokenizes it (PreprocessingDocuments.preProcessing)."""
+    return word_tokenize(' '.join(text.lower().split()))
+
+
+def stats_version():
+    return '{} nltk {}'.format(STATS_VERSION, nltk.__version__)
+
+
+def read_document(entry):
+    """Worker of update_corpus_stats: (name, path, mtime_ns, size) -> the same plus the distinct words of the document."""
+    name, path, mtime_ns, size = entry
+    try:
+        with open(path, 'rt', encoding='utf8') as f:
+            words = set(document_words(f.read()))
+    except (OSError, ValueError) as e:
+        # The document still counts, without words, like in the topic modelling
+        print('Could not read {}: {}'.format(path, e))
+        words = set()
+    return name, mtime_ns, size, sorted(words)
+
+
+def pack_words(words):
+    return zlib.compress('\n'.join(words).encode('utf-8'))
+
+
+def unpack_words(data):
+    text = zlib.decompress(data).decode('utf-8')
+    return text.split('\n') if text else []
+
+
+def connect(stats_path):
+    os.makedirs(os.path.dirname(os.path.abspath(stats_path)), exist_ok=True)
+    connection = sqlite3.connect(stats_path, timeout=60, isolation_level=None)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+    connection.execute('CREATE TABLE IF NOT EXISTS documents (name TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL, '
+                       'size INTEGER NOT NULL, words BLOB NOT NULL)')
+    connection.execute('CREATE TABLE IF NOT EXISTS words (word TEXT PRIMARY KEY, df INTEGER NOT NULL)')
+    return connection
+
+
+def update_corpus_stats(folder, stats_path, workers=1):
+    """
+    Bring the document frequencies up to date with the documents of the folder.
+
+    Parameters:
+    folder (String): folder of the documents, every file is a document
+    stats_path (String): SQLite file of the statistics, created if it does not exist
+    workers (Int): processes tokenizing the new and changed documents
+
+    Returns:
+    Tuple: number of documents (read, removed)
+    """
+    start = time.monotonic()
+    connection = connect(stats_path)
+    version = connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+    if version is not None and version[0] != stats_version():
+        print('Corpus statistics {} are of version {}, rebuilding them'.format(stats_path, version[0]))
+        with connection:
+            connection.execute('BEGIN')
+            connection.execute('DELETE FROM documents')
+            connection.execute('DELETE FROM words')
+    indexed = {name: (mtime_ns, size) for name, mtime_ns, size in
+               connection.execute('SELECT name, mtime_ns, size FROM documents')}
+
+    changed, present = [], set()
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+            present.add(entry.name)
+            if indexed.get(entry.name) != (stat.st_mtime_ns, stat.st_size):
+                changed.append((entry.name, entry.path, stat.st_mtime_ns, stat.st_size))
+    removed = [name for name in indexed if name not in present]
+
+    # The previous words of changed and removed documents no longer count
+    delta = collections.Counter()
+    outdated = [entry[0] for entry in changed if entry[0] in indexed] + removed
+    for name in outdated:
+        row = connection.execute('SELECT words FROM documents WHERE name = ?', (name,)).fetchone()
+        delta.subtract(unpack_words(row[0]))
+
+    rows = []
+    if workers > 1 and len(changed) > 100:
+        with multiprocessing.Pool(workers) as pool:
+            for name, mtime_ns, size, words in pool.imap_unordered(read_document, changed, chunksize=20):
+                delta.update(words)
+                rows.append((name, mtime_ns, size, pack_words(words)))
+    else:
+        for name, mtime_ns, size, words in map(read_document, changed):
+            delta.update(words)
+            rows.append((name, mtime_ns, size, pack_words(words)))
+
+    with connection:
+        connection.execute('BEGIN')
+        connection.executemany('DELETE FROM documents WHERE name = ?', ((name,) for name in removed))
+        connection.executemany('INSERT OR REPLACE INTO documents (name, mtime_ns, size, words) VALUES (?, ?, ?, ?)',
+                               rows)
+        connection.executemany('INSERT INTO words (word, df) VALUES (?, ?) '
+                               'ON CONFLICT (word) DO UPDATE SET df = df + excluded.df',
+                               ((word, count) for word, count in delta.items() if count))
+        connection.execute('DELETE FROM words WHERE df <= 0')
+        connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (stats_version(),))
+    connection.close()
+    print('Corpus statistics {}: {} documents read, {} removed in {:.1f}s'.format(
+        stats_path, len(changed), len(removed), time.monotonic() - start))
+    return len(changed), len(removed)
+
+
+class CorpusStats:
+    """Read-only view of the statistics, every process opens its own connection."""
+
+    def __init__(self, stats_path):
+        self.stats_path = stats_path
+        self.pid = None
+        self.connection = None
+
+    def execute(self, *args):
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.connection = sqlite3.connect('file:{}?mode=ro'.format(self.stats_path), uri=True, timeout=60)
+        return self.connection.execute(*args)
+
+    @property
+    def number_of_documents(self):
+        return self.execute('SELECT COUNT(*) FROM documents').fetchone()[0]
+
+    def document_frequencies(self):
+        """Dict of the number of documents of every word."""
+        return dict(self.execute('SELECT word, df FROM words'))
+
+    def idf(self):
+        """Dict of the inverse document frequency log(N / df) of every word."""
+        number_of_documents = self.number_of_documents
+        return {word: math.log(number_of_documents / df) for word, df in self.execute('SELECT word, df FROM words')}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('folder')
+    parser.add_argument('stats_file')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    update_corpus_stats(args.folder, args.stats_file, args.workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+"""
+Dictionary validation of words, shared by the removeDictionaryWordsCorpus consumer and the
+validation of the topic modelling results (TopicModel/Embeddings+LDA/validateResults.py).
+
+Whether a word is kept, replaced by its correction or dropped only depends on the word and the
+dictionary, but finding out is expensive: a compound split, a spelling correction and the set of
+known words at edit distance 1. check_word does that once per word and WordChecker keeps the
+checks in a common.cache.TokenCache, in memory and optionally in a SQLite file shared by the
+processes and runs, under the version of the dictionary (pyspellchecker and the word list). The
+callers derive their decision and their diagnostics from the check.
+
+The corrections come from pyspellchecker itself or, with the backend 'symspell', from the
+memory-mapped symmetric-delete index of the same dictionary (common/symspell.py), which makes the
+same decisions without generating every string within two edits of a word.
+
+The cache can be filled before the consumers start from the vocabulary of the corpus, in parallel:
+
+Usage:
+python3 dictionary.py <word list> <cache file> <document folder> [<document folder> ...] [--workers N]
+                      [--backend pyspellchecker|symspell] [--spell-index FILE]
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+import spellchecker
+from spellchecker import SpellChecker
+from compound_split import char_split
+
+if __name__ == '__main__':
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.cache import TokenCache
+from common.symspell import load_delete_index
+from common.terminology import file_sha256
+
+BACKENDS = ('pyspellchecker', 'symspell')
+
+
+def load_spell_checker(wordlist_file, backend='pyspellchecker', index_file=None):
+    """
+    Parameters:
+    wordlist_file (String): word list added to the English and German dictionaries
+    backend (String): 'pyspellchecker' or 'symspell'
+    index_file (String): delete index of the symspell backend, defaults to the word list path + .symdel
+
+    Returns:
+    SpellChecker or DeleteIndex: the corrections for check_word
+    """
+    if backend not in BACKENDS:
+        raise ValueError('Unknown spell checker backend {}, expected one of {}'.format(backend, ', '.join(BACKENDS)))
+    if backend == 'symspell':
+        return load_delete_index(wordlist_file, index_file)
+    #Loading PySpellChecker with German corpus to detect Incorrect Words
+    spell = SpellChecker(language=['en', 'de'])
+    spell.word_frequency.load_text_file(wordlist_file)
+    return spell
+
+
+def dictionary_version(wordlist_file, backend='pyspellchecker'):
+    """Version of the checks: pyspellchecker, the word list and the backend."""
+    version = 'pyspellchecker {} wordlist {}'.format(getattr(spellchecker, '__version__', ''), file_sha256(wordlist_file))
+    #The backends only differ in the choice between equally frequent corrections
+    if backend != 'pyspellchecker':
+        version += ' ' + backend
+    return version
+
+
+def check_word(word, spell):
+    """
+    Check a stripped word against the dictionary.
+
+    Returns:
+    List: [word_to_check, compound, split, best_split, dict_word, known_neighbour]
+        word_to_check: the first part of the most probable compound split, otherwise the word
+        compound: the word is a compound word (a split with a positive probability)
+        split: the compound splitter found more than one split
+        best_split: the most probable split of a compound word, otherwise None
+        dict_word: the correction of word_to_check, None if there is none
+        known_neighbour: whether a known word is at edit distance 1, only checked if dict_word is word_to_check
+    """
+    word_to_check = word
+    #Checking if the word is a compound word and if it is than extracting the split with the highest probabilty
+    compound_word_prob = char_split.split_compound(word_to_check)
+    compound = (len(compound_word_prob) > 1) and (compound_word_prob[0][0] > 0)
+    if compound:
+        word_to_check = compound_word_prob[0][1]
+
+    #Checking for the garbage words which are not part of the dictionary
+    dict_word = spell.correction(word_to_check)
+    known_neighbour = None
+    if dict_word == word_to_check:
+        if isinstance(spell, SpellChecker):
+            known_neighbour = bool(spell.known(spell.edit_distance_1(word_to_check)))
+        else:
+            known_neighbour = spell.known_neighbour(word_to_check)
+    return [word_to_check, compound, len(compound_word_prob) > 1, list(compound_word_prob[0]) if compound else None,
+            dict_word, known_neighbour]
+
+
+class WordChecker:
+    """check_word with a cache of the checks by dictionary version."""
+
+    def __init__(self, spell, version, cache=None):
+        """
+        Parameters:
+        spell (SpellChecker or DeleteIndex): from load_spell_checker
+        version (String): from dictionary_version
+        cache (TokenCache): cache of the checks, None to check every word
+        """
+        self.spell = spell
+        self.version = version
+        self.cache = cache
+
+    def check_words(self, words):
+        """Return a dict of the check of every distinct word."""
+        words = list(dict.fromkeys(words))
+        if self.cache is None:
+            return {word: check_word(word, self.spell) for word in words}
+        checks = self.cache.get_many(self.version, words)
+        missing = [(word, check_word(word, self.spell)) for word in words if word not in checks]
+        if missing:
+            self.cache.put_many(self.version, missing)
+            checks.update(missing)
+        return checks
+
+
+def corpus_vocabulary(folders):
+    """Distinct stripped words of the documents of the folders, split like the consumer splits them."""
+    vocabulary = set()
+    for folder in folders:
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if entry.name.startswith('.') or not entry.is_file():
+                    continue
+                with open(entry.path, encoding='utf-8', errors='replace') as f:
+                    vocabulary.update(word.strip() for word in f.read().split(' '))
+    return vocabulary
+
+
+# Spell checker of the pre-warming processes, inherited by the fork
+_spell = None
+
+
+def _check_word(word):
+    return word, check_word(word, _spell)
+
+
+def prewarm(wordlist_file, cache_file, folders, workers=1, cache_file_size=10000000, backend='pyspellchecker',
+            index_file=None):
+    """
+    Check every word of the corpus that is not in the cache file yet.
+
+    Returns:
+    Int: number of words checked
+    """
+    global _spell
+    start = time.monotonic()
+    version = dictionary_version(wordlist_file, backend)
+    # Only the file is filled, the in-process LRU is not needed
+    cache = TokenCache(1, cache_file, cache_file_size)
+    vocabulary = sorted(corpus_vocabulary(folders))
+    cached = cache.get_many(version, vocabulary)
+    missing = [word for word in vocabulary if word not in cached]
+    print('{} distinct words, {} to check'.format(len(vocabulary), len(missing)))
+    if not missing:
+        return 0
+
+    _spell = load_spell_checker(wordlist_file, backend, index_file)
+    checks = []
+    with multiprocessing.get_context('fork').Pool(workers) as pool:
+        for checked, check in enumerate(pool.imap_unordered(_check_word, missing, chunksize=256), 1):
+            checks.append(check)
+            if len(checks) == 10000:
+                cache.put_many(version, checks)
+                checks = []
+                print('{} words checked'.format(checked))
+    cache.put_many(version, checks)
+    print('Checked {} words in {:.1f}s'.format(len(missing), time.monotonic() - start))
+    return len(missing)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('wordlist_file')
+    parser.add_argument('cache_file')
+    parser.add_argument('folders', nargs='+')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--backend', choices=BACKENDS, default='pyspellchecker')
+    parser.add_argument('--spell-index')
+    args = parser.parse_args()
+    prewarm(args.wordlist_file, args.cache_file, args.folders, args.workers, backend=args.backend,
+            index_file=args.spell_index)
+
+
+if __name__ == '__main__':
+    main()
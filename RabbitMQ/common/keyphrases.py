@@ -0,0 +1,90 @@
+"""
+Keyphrase extraction shared by the keyphrase apps (extract_corpusEN_keyphrases,
+extract_corpusDE_keyphrasesCH1, extract_cs_keyphrases).
+
+The apps differ only in their prod_config.yml:
+TERMINOLOGY_FILE: TermSuite TSV of the corpus
+TERMINOLOGY_INDEX: optional path of the binary index, defaults to the TSV path + .idx
+NUMBER_OF_DOCUMENTS_IN_CORPUS: number of documents the terminology was extracted from
+CORPUS_STATS: optional corpus statistics of the documents the terminology was extracted from, which
+    replace NUMBER_OF_DOCUMENTS_IN_CORPUS, built with python3 common/corpusstats.py <folder> <CORPUS_STATS>
+MAX_KEYPHRASES: number of keyphrases per document
+FILTER_STOP_WORDS: drop stopwords from the lemmas of the keyphrases
+STOP_WORDS_DE_FILE, STOP_WORDS_EN_FILE: stopword extensions, only needed with FILTER_STOP_WORDS
+"""
+
+import os
+
+import numpy as np
+
+from common.consumer import ConsumerTask
+from common.corpusstats import CorpusStats
+from common.stopwords import load_stop_words
+from common.terminology import file_sha256, load_terminology_index, top_k
+
+
+def extract_keyphrases(content, terminology, stop_words_de, stop_words_en, max_keyphrases):
+    return extract_keyphrases_batch([content], terminology, stop_words_de, stop_words_en, max_keyphrases)[0]
+
+def extract_keyphrases_batch(contents, terminology, stop_words_de, stop_words_en, max_keyphrases):
+
+    # Find all pilots and their term frequency, one row per document
+    tf = np.stack([terminology.term_frequencies(content.lower()) for content in contents])
+
+    # Calculate the TF-IDF for each pilot in each document, the IDF is precomputed in the terminology index
+    tfidf = (tf / tf.shape[1]) * terminology.idf * terminology.spec
+
+    return [pilots_to_keyphrases(top_k(document_tfidf, max_keyphrases), terminology, stop_words_de, stop_words_en)
+            for document_tfidf in tfidf]
+
+def pilots_to_keyphrases(top_pilots, terminology, stop_words_de=None, stop_words_en=None):
+
+    # Extract the keyphrases from the top pilots, without stopwords the lemmas are kept as they are
+    keyphrases = []
+    for pilot in top_pilots:
+        terms = terminology.lemma(pilot)
+        if isinstance(terms, str):
+            terms = [terms]
+        if stop_words_de is not None:
+            filtered_terms = []
+            for term in terms:
+                if term not in stop_words_de and term not in stop_words_en:
+                    filtered_terms.append(term)
+            terms = filtered_terms
+        keyphrase = ''.join(terms)
+        keyphrases.append(keyphrase)
+
+    return keyphrases
+
+
+class KeyphraseTask(ConsumerTask):
+    """Writes the MAX_KEYPHRASES pilots of the terminology with the highest TF-IDF in each document."""
+
+    def setup(self):
+        self.max_keyphrases = self.config.get('MAX_KEYPHRASES', 50)
+        number_of_documents = self.config.get('NUMBER_OF_DOCUMENTS_IN_CORPUS')
+        if self.config.get('CORPUS_STATS'):
+            if os.path.exists(self.config['CORPUS_STATS']):
+                number_of_documents = CorpusStats(self.config['CORPUS_STATS']).number_of_documents
+            else:
+                print('No corpus statistics {}, using NUMBER_OF_DOCUMENTS_IN_CORPUS'.format(self.config['CORPUS_STATS']))
+        self.terminology = load_terminology_index(self.config['TERMINOLOGY_FILE'], number_of_documents,
+                                                  self.config.get('TERMINOLOGY_INDEX'))
+        self.stop_words_de, self.stop_words_en = None, None
+        if self.config.get('FILTER_STOP_WORDS', False):
+            self.stop_words_de, self.stop_words_en = load_stop_words(self.config)
+
+    def result_version(self):
+        version = '{} terminology {} documents {}'.format(super().result_version(),
+                                                          self.terminology.header['source_sha256'],
+                                                          self.terminology.number_of_documents)
+        if self.stop_words_de is not None:
+            version += ' stopwords {} {}'.format(file_sha256(self.config['STOP_WORDS_DE_FILE']),
+                                                 file_sha256(self.config['STOP_WORDS_EN_FILE']))
+        return version
+
+    def process_batch(self, tasks):
+        # Score all documents of the batch together
+        keyphrases = extract_keyphrases_batch([task['contents'] for task in tasks], self.terminology,
+                                              self.stop_words_de, self.stop_words_en, self.max_keyphrases)
+        return [' '.join(document_keyphrases) for document_keyphrases in keyphrases]
@@ -0,0 +1,161 @@
+"""
+Index of the document languages: PPN -> language code of the metadata JSON files
+(<METADATA_FOLDER>/<ppn>.json, field language.language).
+
+Reading and parsing a whole metadata document to find its language costs far more than the
+lookup in this SQLite file. The index records the mtime and size of every metadata file it read,
+update_language_index only parses the files that are new or changed since and drops the removed
+ones, so it can run at every start of a consumer.
+
+Used by the lemma_corpus consumer (LANGUAGE_INDEX in its prod_config.yml), the topic modelling
+preprocessing (lda/language_index in its Config.yaml) and Elastic/indexElastic.py. Like the
+caches the file belongs on a local disk.
+
+Usage:
+python3 languages.py <metadata folder> <index file> [--workers N]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sqlite3
+import time
+
+
+def metadata_language(path):
+    """
+    Language of a metadata file.
+
+    Returns:
+    Tuple: (whether language.language is present, its value), an explicit null is (True, None)
+    """
+    with open(path, "r") as json_file:
+        metadata = json.load(json_file)
+    language = metadata.get("language", {})
+    if not isinstance(language, dict):
+        raise ValueError('language is not an object')
+    if "language" not in language:
+        return False, None
+    value = language["language"]
+    if value is not None and not isinstance(value, str):
+        value = json.dumps(value)
+    return True, value
+
+
+def read_metadata_file(entry):
+    """Worker of update_language_index: (ppn, path, mtime_ns, size) -> the same plus the language, or None."""
+    ppn, path, mtime_ns, size = entry
+    try:
+        has_language, language = metadata_language(path)
+        return ppn, has_language, language, mtime_ns, size
+    except (OSError, ValueError, AttributeError) as e:
+        print('Could not read the language of {}: {}'.format(path, e))
+        return None
+
+
+def connect(index_path):
+    os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+    connection = sqlite3.connect(index_path, timeout=60, isolation_level=None)
+    connection.execute('PRAGMA journal_mode=WAL')
+    columns = [row[1] for row in connection.execute('PRAGMA table_info(languages)')]
+    if columns and 'has_language' not in columns:
+        # Indexes that did not tell a missing language from a null one are read again
+        connection.execute('DROP TABLE languages')
+    connection.execute('CREATE TABLE IF NOT EXISTS languages (ppn TEXT PRIMARY KEY, has_language INTEGER NOT NULL, '
+                       'language TEXT, mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL)')
+    return connection
+
+
+def update_language_index(metadata_folder, index_path, workers=1):
+    """
+    Bring the index up to date with the metadata folder.
+
+    Parameters:
+    metadata_folder (String): folder of the <ppn>.json metadata files
+    index_path (String): SQLite file of the index, created if it does not exist
+    workers (Int): processes parsing the new and changed files
+
+    Returns:
+    Tuple: number of files (read, removed)
+    """
+    start = time.monotonic()
+    connection = connect(index_path)
+    indexed = {ppn: (mtime_ns, size) for ppn, mtime_ns, size in
+               connection.execute('SELECT ppn, mtime_ns, size FROM languages')}
+
+    changed, present = [], set()
+    with os.scandir(metadata_folder) as entries:
+        for entry in entries:
+            if entry.name.startswith('.') or not entry.name.endswith('.json'):
+                continue
+            ppn = entry.name[:-len('.json')]
+            stat = entry.stat()
+            present.add(ppn)
+            if indexed.get(ppn) != (stat.st_mtime_ns, stat.st_size):
+                changed.append((ppn, entry.path, stat.st_mtime_ns, stat.st_size))
+    removed = [ppn for ppn in indexed if ppn not in present]
+
+    if workers > 1 and len(changed) > 1000:
+        with multiprocessing.Pool(workers) as pool:
+            rows = pool.map(read_metadata_file, changed, chunksize=1000)
+    else:
+        rows = [read_metadata_file(entry) for entry in changed]
+
+    with connection:
+        connection.execute('BEGIN')
+        connection.executemany('INSERT OR REPLACE INTO languages (ppn, has_language, language, mtime_ns, size) '
+                               'VALUES (?, ?, ?, ?, ?)', (row for row in rows if row is not None))
+        # Files that could not be read are dropped, their readers fall back to the metadata file
+        connection.executemany('DELETE FROM languages WHERE ppn = ?',
+                               ((ppn,) for ppn in removed + [entry[0] for entry, row in zip(changed, rows)
+                                                             if row is None]))
+    connection.close()
+    print('Language index {}: {} metadata files read, {} removed in {:.1f}s'.format(
+        index_path, len(changed), len(removed), time.monotonic() - start))
+    return len(changed), len(removed)
+
+
+class LanguageIndex:
+    """Read-only lookups in the index, every process opens its own connection."""
+
+    def __init__(self, index_path):
+        self.index_path = index_path
+        self.pid = None
+        self.connection = None
+
+    def execute(self, *args):
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.connection = sqlite3.connect('file:{}?mode=ro'.format(self.index_path), uri=True, timeout=60)
+        return self.connection.execute(*args)
+
+    def __getitem__(self, ppn):
+        """Language of a PPN, None if its metadata has none; KeyError if it is not indexed."""
+        row = self.execute('SELECT language FROM languages WHERE ppn = ?', (ppn,)).fetchone()
+        if row is None:
+            raise KeyError(ppn)
+        return row[0]
+
+    def language(self, ppn, default=None):
+        """
+        Language of a PPN as its metadata has it: default if language.language is missing, otherwise
+        its value, which may be None or empty; KeyError if the PPN is not indexed.
+        """
+        row = self.execute('SELECT has_language, language FROM languages WHERE ppn = ?', (ppn,)).fetchone()
+        if row is None:
+            raise KeyError(ppn)
+        return row[1] if row[0] else default
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('metadata_folder')
+    parser.add_argument('index_file')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    update_language_index(args.metadata_folder, args.index_file, args.workers)
+
+
+if __name__ == '__main__':
+    main()
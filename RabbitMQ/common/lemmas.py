@@ -0,0 +1,133 @@
+"""
+Lemmatization of the lemma_corpus app.
+
+The words of a document come from NLTK's word_tokenize like they always did, but instead of one
+spaCy Doc per word the words are handed to the model as pre-tokenized Docs of up to
+LEMMA_CHUNK_WORDS words, so the tagger sees every word in its sentence and the pipeline runs once
+per chunk instead of once per word. The parser and NER are not loaded, only the components the
+lemmas and POS tags need.
+
+Settings of the prod_config.yml:
+LEMMA_CHUNK_WORDS: words per Doc, chunks end at a sentence end where there is one
+SPACY_BATCH_SIZE: Docs per batch of nlp.pipe
+SPACY_PROCESSES: processes of nlp.pipe; every consumer worker (--workers) starts that many
+
+With LEMMA_CACHE_SIZE the lemma and POS tag of every word are cached instead (common.cache.TokenCache)
+by language, model and word: only the distinct words of a batch that are not cached yet go through
+the model, each as a Doc of its own, so a word always gets the lemma it has out of context.
+Enabling the cache trades the tagging in context for speed, so it is off unless LEMMA_CACHE_SIZE
+is set.
+LEMMA_CACHE_SIZE: words cached in every process
+LEMMA_CACHE_FILE: optional SQLite file on a local disk shared by the processes and runs
+LEMMA_CACHE_FILE_SIZE: words kept in the file
+"""
+
+import spacy
+from spacy.tokens import Doc
+
+# Components the lemmas and POS tags do not need
+EXCLUDED_COMPONENTS = ['parser', 'ner']
+
+SENTENCE_ENDS = {'.', '!', '?'}
+
+# Single word Docs per batch of nlp.pipe
+WORD_BATCH_SIZE = 1000
+
+
+def load_model(name):
+    """Load a spaCy model without the parser and NER."""
+    return spacy.load(name, exclude=EXCLUDED_COMPONENTS)
+
+
+def chunk_words(words, max_words):
+    """Split a list of words into chunks of at most max_words, ending after the last sentence end of a chunk if possible."""
+    start = 0
+    while start < len(words):
+        end = min(start + max_words, len(words))
+        if end < len(words):
+            for i in range(end - 1, start, -1):
+                if words[i] in SENTENCE_ENDS:
+                    end = i + 1
+                    break
+        yield words[start:end]
+        start = end
+
+
+class Lemmatizer:
+    """Lemmas of the words of documents in one language, without proper nouns and stopwords."""
+
+    def __init__(self, nlp, stop_words_de, stop_words_en, chunk_size=5000, batch_size=32, n_process=1,
+                 cache=None, language=None):
+        """
+        Parameters:
+        nlp (Language): spaCy model of the language, see load_model
+        stop_words_de (Set): German stopwords
+        stop_words_en (Set): English stopwords
+        chunk_size (Int): words per Doc
+        batch_size (Int): Docs per batch of nlp.pipe
+        n_process (Int): processes of nlp.pipe
+        cache (TokenCache): cache of the lemma and POS tag of every word, None to lemmatize in context
+        language (String): language of the model, part of the cache keys
+        """
+        self.nlp = nlp
+        self.stop_words_de = stop_words_de
+        self.stop_words_en = stop_words_en
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        self.n_process = n_process
+        self.cache = cache
+        self.namespace = '{} {}-{} {}'.format(language, nlp.meta['name'], nlp.meta['version'],
+                                              '+'.join(nlp.pipe_names))
+
+    def keep(self, word, pos):
+        # Ignore proper nouns (PROPN) and words that are a stopword in German or English
+        return pos != "PROPN" and word.lower() not in self.stop_words_de and word.lower() not in self.stop_words_en
+
+    def lemmatize_words(self, word_lists):
+        """
+        Lemmatize the words of several documents in one stream of Docs.
+
+        Parameters:
+        word_lists (List): list of words of every document
+
+        Returns:
+        List: the kept lemmas of every document joined by spaces
+        """
+        if self.cache is not None:
+            return self.lemmatize_cached_words(word_lists)
+
+        chunks = [list(chunk_words(words, self.chunk_size)) for words in word_lists]
+        docs = self.nlp.pipe((Doc(self.nlp.vocab, words=chunk) for document in chunks for chunk in document),
+                             batch_size=self.batch_size, n_process=self.n_process)
+
+        lemmatized_contents = []
+        for document in chunks:
+            lemmatized_words = []
+            for _ in document:
+                lemmatized_words.extend(token.lemma_ for token in next(docs) if self.keep(token.text, token.pos_))
+            # Join the lemmatized words back into a string
+            lemmatized_contents.append(" ".join(lemmatized_words))
+        return lemmatized_contents
+
+    def lemmatize_cached_words(self, word_lists):
+        # Only the distinct words that are not cached yet go through the model
+        words = list(dict.fromkeys(word for words in word_lists for word in words))
+        analyses = self.cache.get_many(self.namespace, words)
+        missing = [word for word in words if word not in analyses]
+        if missing:
+            docs = self.nlp.pipe((Doc(self.nlp.vocab, words=[word]) for word in missing),
+                                 batch_size=WORD_BATCH_SIZE, n_process=self.n_process)
+            new_analyses = [(word, (doc[0].lemma_, doc[0].pos_)) for word, doc in zip(missing, docs)]
+            self.cache.put_many(self.namespace, new_analyses)
+            analyses.update(new_analyses)
+
+        lemmatized_contents = []
+        for words in word_lists:
+            lemmatized_words = []
+            for word in words:
+                lemma, pos = analyses[word]
+                if self.keep(word, pos):
+                    lemmatized_words.append(lemma)
+            # Join the lemmatized words back into a string
+            lemmatized_contents.append(" ".join(lemmatized_words))
+        return lemmatized_contents
@@ -0,0 +1,174 @@
+"""
+Message formats understood by the RabbitMQ consumers.
+
+Inline task, the document travels inside the message:
+{"filename": "<output filename>", "contents": "<document text>"}
+
+Claim-check task, the message only references a file below the INPUT_FOLDER of prod_config.yml,
+which producer and consumers both see on the shared drive:
+{"filename": "<output filename>", "path": "<path relative to INPUT_FOLDER>", "size": <bytes>, "sha256": "<hex digest>"}
+
+The consumer memory-maps the referenced file, checks its size and hash and decodes the text
+straight from the mapping, so the document is neither JSON-escaped nor copied through the broker.
+
+Bodies may be compressed; the content_encoding property of the message names the codec
+(zlib/deflate, gzip, or zstd when the zstandard package is installed) and the consumer
+decompresses before decoding the JSON. Producers use compress_body, which only compresses
+bodies above a size threshold.
+"""
+
+import gzip
+import hashlib
+import json
+import mmap
+import os
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# gzip raises OSError (BadGzipFile) or EOFError on corrupt or truncated bodies
+DECOMPRESS_ERRORS = (zlib.error, OSError, EOFError) + ((zstandard.ZstdError,) if zstandard is not None else ())
+
+# Bodies below this size are sent uncompressed, compressing them saves less than it costs
+COMPRESS_THRESHOLD = 16 * 1024
+
+
+def supported_encodings():
+    """Content encodings this process can compress and decompress."""
+    encodings = ['zlib', 'deflate', 'gzip']
+    if zstandard is not None:
+        encodings.append('zstd')
+    return encodings
+
+
+def compress_body(body, encoding='gzip', threshold=COMPRESS_THRESHOLD):
+    """
+    Compress a message body for publishing.
+
+    Parameters:
+    body (Bytes): encoded task
+    encoding (String): zlib, deflate, gzip or zstd; None disables compression
+    threshold (Int): bodies smaller than this are sent as they are
+
+    Returns:
+    Tuple: (body, content_encoding) where content_encoding is None if the body was not compressed
+    """
+    if encoding is None or len(body) < threshold:
+        return body, None
+    if encoding in ('zlib', 'deflate'):
+        return zlib.compress(body), encoding
+    if encoding == 'gzip':
+        return gzip.compress(body), encoding
+    if encoding == 'zstd' and zstandard is not None:
+        return zstandard.ZstdCompressor().compress(body), encoding
+    raise ValueError('Unsupported content encoding {}, supported: {}'.format(encoding, supported_encodings()))
+
+
+def decompress_body(body, content_encoding):
+    """
+    Undo compress_body according to the content_encoding property of the message.
+
+    Raises:
+    ValueError: if the encoding is not supported or the body is corrupt
+    """
+    if not content_encoding or content_encoding == 'identity':
+        return body
+    try:
+        if content_encoding in ('zlib', 'deflate'):
+            return zlib.decompress(body)
+        if content_encoding == 'gzip':
+            return gzip.decompress(body)
+        if content_encoding == 'zstd' and zstandard is not None:
+            return zstandard.ZstdDecompressor().decompressobj().decompress(body)
+    except DECOMPRESS_ERRORS as e:
+        raise ValueError('Could not decompress {} body: {}'.format(content_encoding, e)) from e
+    raise ValueError('Unsupported content encoding {}, supported: {}'.format(content_encoding, supported_encodings()))
+
+
+def encode_task(filename, contents):
+    """Build the body of an inline task."""
+    return json.dumps({'filename': filename, 'contents': contents}).encode('utf-8')
+
+
+def encode_claim_check(filename, path, input_folder):
+    """
+    Build the body of a claim-check task for a file below input_folder.
+
+    Parameters:
+    filename (String): name of the output file the consumer writes
+    path (String): path of the document, absolute or relative to input_folder
+    input_folder (String): INPUT_FOLDER of the prod_config.yml
+    """
+    full_path = os.path.join(input_folder, path)
+    sha256 = hashlib.sha256()
+    size = 0
+    with open(full_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha256.update(block)
+            size += len(block)
+    return json.dumps({'filename': filename, 'path': os.path.relpath(full_path, input_folder),
+                       'size': size, 'sha256': sha256.hexdigest()}).encode('utf-8')
+
+
+def resolve_claim_check(path, input_folder):
+    """Resolve the referenced path, refusing anything outside of input_folder."""
+    root = os.path.realpath(input_folder)
+    full_path = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, full_path]) != root:
+        raise ValueError('Claim-check path {} is outside of {}'.format(path, input_folder))
+    return full_path
+
+
+def read_claim_check(task, input_folder):
+    """
+    Read the document referenced by a claim-check task.
+
+    Returns:
+    String: the text of the document
+
+    Raises:
+    ValueError: if the file does not match the size or hash of the task
+    """
+    full_path = resolve_claim_check(task['path'], input_folder)
+    with open(full_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size != task['size']:
+            raise ValueError('{} has {} bytes, the task expects {}'.format(full_path, size, task['size']))
+        # Empty files cannot be memory-mapped
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        try:
+            if hashlib.sha256(data).hexdigest() != task['sha256']:
+                raise ValueError('{} does not match the hash of the task'.format(full_path))
+            return str(data, 'utf-8')
+        finally:
+            if size:
+                data.close()
+
+
+def task_filename(body, content_encoding=None):
+    """Filename of a task for the log, without reading the document of a claim-check task; None if the body is invalid."""
+    try:
+        return json.loads(decompress_body(body, content_encoding).decode('utf-8')).get('filename')
+    except (ValueError, AttributeError) + DECOMPRESS_ERRORS:
+        return None
+
+
+def decode_task(body, input_folder='', content_encoding=None):
+    """
+    Decode an inline or claim-check task.
+
+    Parameters:
+    body (Bytes): message body
+    input_folder (String): folder the paths of claim-check tasks are relative to
+    content_encoding (String): content_encoding property of the message
+
+    Returns:
+    Dict: the task with the document text in 'contents'
+    """
+    task = json.loads(decompress_body(body, content_encoding).decode('utf-8'))
+    if 'contents' not in task:
+        task['contents'] = read_claim_check(task, input_folder)
+    return task
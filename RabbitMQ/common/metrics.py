@@ -0,0 +1,129 @@
+"""
+Metrics of the RabbitMQ consumers.
+
+With METRICS_PORT in the prod_config.yml the consumer serves the metrics in the Prometheus text
+format on http://<host>:<METRICS_PORT>/metrics:
+
+consumer_messages_total{queue, result}: settled messages, result is acked or rejected; the
+    messages per second are rate(consumer_messages_total[1m])
+consumer_stage_seconds{queue, stage}: time a batch spends in each stage; decode, process and
+    write are measured in the worker, ack from the end of the batch in the worker until its
+    delivery tags are settled on the connection thread
+consumer_document_characters{queue}: length of the decoded documents
+consumer_errors_total{queue, stage}: messages that failed to decode or to process
+consumer_in_flight_messages{queue}: messages received and not yet settled
+consumer_result_cache_total{queue, result}: documents found (hit) or not (miss) in the RESULT_CACHE
+consumer_cache_lookups_total{queue, cache, result}: lookups in the caches of a task, e.g. its
+    common.cache.TokenCache; result is memory or disk for hits and miss
+consumer_worker_resident_memory_bytes{pid}: RSS of every worker after its last batch; the RSS
+    of the consumer process itself is process_resident_memory_bytes
+
+Only the consumer process, which owns the connection, exports metrics. The workers return their
+measurements together with the result of every batch.
+"""
+
+import collections
+import os
+import time
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+STAGES = ('decode', 'process', 'write', 'ack')
+
+MESSAGES = Counter('consumer_messages', 'Settled messages', ['queue', 'result'])
+STAGE_SECONDS = Histogram('consumer_stage_seconds', 'Seconds a batch spends in each stage', ['queue', 'stage'],
+                          buckets=(.001, .005, .01, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 120, 300))
+DOCUMENT_CHARACTERS = Histogram('consumer_document_characters', 'Length of the decoded documents', ['queue'],
+                                buckets=(1e2, 1e3, 1e4, 3e4, 1e5, 3e5, 1e6, 3e6, 1e7, 3e7))
+ERRORS = Counter('consumer_errors', 'Messages that could not be decoded or processed', ['queue', 'stage'])
+IN_FLIGHT = Gauge('consumer_in_flight_messages', 'Messages received and not yet settled', ['queue'])
+RESULT_CACHE = Counter('consumer_result_cache', 'Lookups in the result cache', ['queue', 'result'])
+CACHE_LOOKUPS = Counter('consumer_cache_lookups', 'Lookups in the caches of a task', ['queue', 'cache', 'result'])
+WORKER_RSS = Gauge('consumer_worker_resident_memory_bytes', 'Resident memory of the workers', ['pid'])
+
+
+def resident_memory():
+    """Current RSS of this process in bytes, 0 where /proc is not available."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def new_batch_stats():
+    """Measurements of one batch, filled in by common.runtime.process_bodies."""
+    return {'decode': 0.0, 'process': 0.0, 'write': 0.0, 'sizes': [], 'decode_errors': 0, 'process_errors': 0,
+            'cache_hits': 0, 'cache_misses': 0, 'lookups': {}}
+
+
+def start_metrics_server(port):
+    """Serve /metrics on port, in a daemon thread of this process."""
+    start_http_server(port)
+    print(f'Serving metrics on port {port}')
+
+
+class ConsumerMetrics:
+    """Metrics of one queue; the counters of the periodic log line survive reconnections."""
+
+    def __init__(self, queue_name):
+        self.queue_name = queue_name
+        self.started = time.monotonic()
+        self.messages = 0
+        self.failed = 0
+        self.batches = 0
+        self.processing_seconds = 0.0
+        # (cache, result) -> lookups, for the hit rates of the log line
+        self.lookups = collections.Counter()
+
+    def set_in_flight(self, count):
+        IN_FLIGHT.labels(self.queue_name).set(count)
+
+    def record_batch(self, size, failed, stats):
+        """
+        Record a settled batch.
+
+        Parameters:
+        size (Int): messages in the batch
+        failed (Int): rejected messages
+        stats (Dict): measurements of the batch from new_batch_stats, with 'ack' and for worker batches 'pid'
+                      and 'rss'
+        """
+        self.batches += 1
+        self.messages += size
+        self.failed += failed
+        self.processing_seconds += stats['process'] + stats['write']
+
+        MESSAGES.labels(self.queue_name, 'acked').inc(size - failed)
+        MESSAGES.labels(self.queue_name, 'rejected').inc(failed)
+        for stage in STAGES:
+            STAGE_SECONDS.labels(self.queue_name, stage).observe(stats.get(stage, 0.0))
+        for length in stats['sizes']:
+            DOCUMENT_CHARACTERS.labels(self.queue_name).observe(length)
+        ERRORS.labels(self.queue_name, 'decode').inc(stats['decode_errors'])
+        ERRORS.labels(self.queue_name, 'process').inc(stats['process_errors'])
+        RESULT_CACHE.labels(self.queue_name, 'hit').inc(stats['cache_hits'])
+        RESULT_CACHE.labels(self.queue_name, 'miss').inc(stats['cache_misses'])
+        for (cache, result), count in stats['lookups'].items():
+            CACHE_LOOKUPS.labels(self.queue_name, cache, result).inc(count)
+            self.lookups[(cache, result)] += count
+        if stats.get('rss'):
+            WORKER_RSS.labels(str(stats['pid'])).set(stats['rss'])
+
+    def hit_rates(self):
+        """Share of the lookups of every cache that were hits."""
+        totals, misses = collections.Counter(), collections.Counter()
+        for (cache, result), count in self.lookups.items():
+            totals[cache] += count
+            if result == 'miss':
+                misses[cache] += count
+        return {cache: 1 - misses[cache] / total for cache, total in totals.items() if total}
+
+    def summary(self):
+        elapsed = time.monotonic() - self.started
+        summary = '{}: {} messages ({} failed) in {} batches, {:.2f} messages/s, {:.3f}s processing per message'.format(
+            self.queue_name, self.messages, self.failed, self.batches, self.messages / elapsed if elapsed else 0.0,
+            self.processing_seconds / self.messages if self.messages else 0.0)
+        for cache, hit_rate in sorted(self.hit_rates().items()):
+            summary += ', {} cache {:.1%} hits'.format(cache, hit_rate)
+        return summary
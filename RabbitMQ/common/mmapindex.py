@@ -0,0 +1,132 @@
+"""
+Sectioned index files which the consumers memory-map, shared by the terminology index
+(common.terminology) and the delete index of the spelling correction (common.symspell).
+
+A file starts with a preamble (magic, format version, header length) and a JSON header with
+the fields of the index and its sections: the offset (after the header), typecode and size of
+every array. The arrays are 8-byte aligned and read as memoryviews on the mapped file, so all
+consumers on a host share the same pages.
+"""
+
+import array
+import json
+import mmap
+import os
+import struct
+
+PREAMBLE = struct.Struct('<16sII')
+
+
+def align(offset):
+    return (offset + 7) & ~7
+
+
+def string_at(text, offsets, index):
+    return bytes(text[offsets[index]:offsets[index + 1]]).decode('utf-8')
+
+
+def string_table(strings):
+    """The UTF-8 text of the strings, concatenated, and the offsets of the strings in it."""
+    offsets = array.array('I', [0])
+    text = bytearray()
+    for string in strings:
+        text += string.encode('utf-8')
+        offsets.append(len(text))
+    return offsets, array.array('B', text)
+
+
+def write_index(path, magic, version, header, arrays):
+    """
+    Write an index file.
+
+    Parameters:
+    path (String): path of the index
+    magic (Bytes): 16 bytes naming the kind of index
+    version (Int): version of the file format
+    header (Dict): fields of the index, the sections are added to them
+    arrays (Dict): array.array of every section, by name
+
+    Returns:
+    String: path of the written index
+    """
+    sections = {}
+    offset = 0
+    for name, values in arrays.items():
+        sections[name] = [offset, values.typecode, len(values) * values.itemsize]
+        offset = align(offset + len(values) * values.itemsize)
+    header = json.dumps(dict(header, sections=sections)).encode('utf-8')
+
+    # Several consumers may start at the same time, so write to a private file and rename it into place
+    temp_file = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temp_file, 'wb') as f:
+        f.write(PREAMBLE.pack(magic, version, len(header)))
+        f.write(header)
+        data_start = align(PREAMBLE.size + len(header))
+        f.write(b'\0' * (data_start - f.tell()))
+        for name, values in arrays.items():
+            f.write(b'\0' * (data_start + sections[name][0] - f.tell()))
+            f.write(values.tobytes())
+    os.replace(temp_file, path)
+    return path
+
+
+class MappedIndex:
+    """An index file mapped into memory: its header and a memoryview of every section."""
+
+    def __init__(self, path, magic, version):
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.mm)
+        self.sections = {}
+        try:
+            self.header = self.read_header(path, magic, version)
+        except Exception:
+            self.close()
+            raise
+
+    def read_header(self, path, magic, version):
+        if len(self.mm) < PREAMBLE.size:
+            raise ValueError('{} is truncated'.format(path))
+        file_magic, file_version, header_length = PREAMBLE.unpack_from(self.mm)
+        if file_magic != magic or file_version != version:
+            raise ValueError('{} is not a {} index of version {}'.format(
+                path, magic.rstrip(b'\0').decode('ascii'), version))
+        data_start = align(PREAMBLE.size + header_length)
+        if data_start > len(self.mm):
+            raise ValueError('{} is truncated'.format(path))
+        header = json.loads(self.mm[PREAMBLE.size:PREAMBLE.size + header_length].decode('utf-8'))
+        for name, (offset, typecode, nbytes) in header['sections'].items():
+            start = data_start + offset
+            if offset < 0 or nbytes < 0 or start + nbytes > len(self.mm):
+                raise ValueError('{} is truncated in section {}'.format(path, name))
+            try:
+                self.sections[name] = self.view[start:start + nbytes].cast(typecode)
+            except TypeError as e:
+                raise ValueError('Section {} of {} is invalid: {}'.format(name, path, e)) from e
+        return header
+
+    def close(self):
+        """
+        Unmap the file. Arrays created on the sections (e.g. with numpy.frombuffer) have to be
+        dropped first, the sections cannot be used afterwards.
+        """
+        for section in self.sections.values():
+            section.release()
+        self.view.release()
+        self.mm.close()
+
+
+def read_index(path, magic, version):
+    """
+    Memory-map an index file.
+
+    Parameters:
+    path (String): path of the index
+    magic (Bytes): 16 bytes naming the kind of index
+    version (Int): version of the file format
+
+    Returns:
+    MappedIndex: the header and the sections of the index, ValueError if the file is not an
+    index of this kind and version or is truncated
+    """
+    return MappedIndex(path, magic, version)
@@ -0,0 +1,266 @@
+"""
+Producer of the RabbitMQ apps: sends every file of INPUT_FOLDER to QUEUE_NAME.
+
+The folder is streamed with os.scandir and the files are read and encoded on a reader thread
+while the connection publishes. Publishing is pipelined: up to PUBLISH_WINDOW messages, together
+at most PUBLISH_WINDOW_BYTES, may wait for their publisher confirm at a time, and the broker
+confirms them asynchronously, usually many with one multiple ack. The producer keeps their bodies
+to publish them again if the broker refuses them.
+
+Every confirmed file is appended to the journal SENT_FILE_LIST (relative to the prod_config.yml).
+A restarted producer reads the journal into a set once and skips the files in it, files that
+were published but not confirmed are sent again.
+
+The producer stops publishing while the queue holds MAX_QUEUE_DEPTH (default 10000, 0 for no
+limit) messages, its depth is checked every QUEUE_CHECK_INTERVAL seconds.
+
+Other settings of the prod_config.yml:
+CLAIM_CHECK: send claim-check tasks that reference the files instead of their contents (common.messages)
+COMPRESSION: zlib, gzip or zstd for inline tasks above COMPRESS_THRESHOLD bytes
+READ_AHEAD, READ_AHEAD_BYTES: encoded files and their bytes the reader thread keeps ready at most
+"""
+
+import os
+import queue
+import threading
+import time
+
+import pika
+
+from common.consumer import connect_parameters, load_config
+from common.messages import COMPRESS_THRESHOLD, compress_body, encode_claim_check, encode_task
+
+
+def load_journal(journal_file):
+    """Return the set of files confirmed by earlier runs."""
+    try:
+        with open(journal_file, encoding='utf-8') as journal:
+            return set(line.rstrip('\n') for line in journal)
+    except FileNotFoundError:
+        return set()
+
+
+def pending_files(input_folder, sent):
+    """Stream the names of the files of input_folder that were not sent yet, hidden and temporary files are skipped."""
+    with os.scandir(input_folder) as entries:
+        for entry in entries:
+            if entry.name.startswith('.') or entry.name in sent:
+                continue
+            if entry.is_file():
+                yield entry.name
+
+
+class Producer:
+    """Publishes the pending files of INPUT_FOLDER with publisher confirms over a SelectConnection."""
+
+    def __init__(self, config, journal_file):
+        """
+        Parameters:
+        config (Dict): prod_config.yml of the app
+        journal_file (String): journal of the confirmed files
+        """
+        self.config = config
+        self.queue_name = config['QUEUE_NAME']
+        self.input_folder = config['INPUT_FOLDER']
+        self.journal_file = journal_file
+        self.window = config.get('PUBLISH_WINDOW', 1000)
+        self.window_bytes = config.get('PUBLISH_WINDOW_BYTES', 64 * 1024 * 1024)
+        self.max_queue_depth = config.get('MAX_QUEUE_DEPTH', 10000)
+        self.queue_check_interval = config.get('QUEUE_CHECK_INTERVAL', 1.0)
+        self.claim_check = config.get('CLAIM_CHECK', False)
+        self.compression = config.get('COMPRESSION')
+        self.compress_threshold = config.get('COMPRESS_THRESHOLD', COMPRESS_THRESHOLD)
+
+        # (filename, body, content_encoding) ready to publish, None once every file was read
+        self.bodies = queue.Queue(config.get('READ_AHEAD', 2 * self.window))
+        # Bytes of the bodies in self.bodies, the reader thread waits while they exceed READ_AHEAD_BYTES
+        self.read_ahead_bytes = config.get('READ_AHEAD_BYTES', 64 * 1024 * 1024)
+        self.buffered_bytes = 0
+        self.buffer_space = threading.Condition()
+        # Delivery tag -> (filename, body, content_encoding) of the messages waiting for their confirm
+        self.unconfirmed = {}
+        self.unconfirmed_bytes = 0
+        # Messages the broker refused (nack), published again
+        self.retry = []
+        self.delivery_tag = 0
+        self.reading_done = False
+        self.publish_scheduled = False
+        self.queue_depth = 0
+        self.published_since_check = 0
+        self.checking_queue_depth = False
+        self.sent = 0
+        self.skipped = 0
+        self.error = None
+        self.connection = None
+        self.channel = None
+        self.journal = None
+
+    def encode(self, filename):
+        if self.claim_check:
+            return encode_claim_check(filename, filename, self.input_folder), None
+        with open(os.path.join(self.input_folder, filename), encoding='utf-8', errors='replace') as file:
+            body = encode_task(filename, file.read())
+        return compress_body(body, self.compression, self.compress_threshold)
+
+    def read_files(self, sent):
+        """Reader thread: encodes the pending files, blocks while READ_AHEAD files or READ_AHEAD_BYTES are waiting."""
+        try:
+            for filename in pending_files(self.input_folder, sent):
+                try:
+                    item = (filename,) + self.encode(filename)
+                except OSError as e:
+                    print(f'Could not read {filename}: {e}')
+                    self.skipped += 1
+                    continue
+                with self.buffer_space:
+                    # A file larger than READ_AHEAD_BYTES is still sent, on its own
+                    self.buffer_space.wait_for(lambda: not self.buffered_bytes
+                                               or self.buffered_bytes + len(item[1]) <= self.read_ahead_bytes)
+                    self.buffered_bytes += len(item[1])
+                self.bodies.put(item)
+        finally:
+            self.bodies.put(None)
+
+    def run(self):
+        """
+        Send all pending files.
+
+        Returns:
+        Bool: True if every file was sent and confirmed
+        """
+        sent = load_journal(self.journal_file)
+        print(f'{len(sent)} files were sent before, sending the others of {self.input_folder} to {self.queue_name}')
+        threading.Thread(target=self.read_files, args=(sent,), daemon=True).start()
+        self.started = time.monotonic()
+        self.journal = open(self.journal_file, 'a', encoding='utf-8')
+        try:
+            self.connection = pika.SelectConnection(connect_parameters(self.config),
+                                                    on_open_callback=self.on_connection_open,
+                                                    on_open_error_callback=self.on_connection_error,
+                                                    on_close_callback=self.on_connection_closed)
+            self.connection.ioloop.start()
+        finally:
+            self.journal.close()
+
+        elapsed = time.monotonic() - self.started
+        print(f'Sent {self.sent} files in {elapsed:.1f}s ({self.sent / elapsed if elapsed else 0:.0f}/s), '
+              f'{self.skipped} could not be read')
+        if self.error is not None:
+            print(f'Stopped by {self.error!r}, run the producer again to send the remaining files')
+        return self.error is None
+
+    def on_connection_open(self, connection):
+        connection.channel(on_open_callback=self.on_channel_open)
+
+    def on_connection_error(self, connection, error):
+        self.error = error
+        connection.ioloop.stop()
+
+    def on_connection_closed(self, connection, reason):
+        if not self.finished():
+            self.error = reason
+        connection.ioloop.stop()
+
+    def on_channel_open(self, channel):
+        self.channel = channel
+        channel.add_on_close_callback(lambda channel, reason: self.close())
+        channel.confirm_delivery(self.on_confirm)
+        channel.queue_declare(queue=self.queue_name, durable=True, callback=self.on_queue_declared)
+
+    def on_queue_declared(self, frame):
+        self.queue_depth = frame.method.message_count
+        self.published_since_check = 0
+        if self.max_queue_depth and not self.checking_queue_depth:
+            self.checking_queue_depth = True
+            self.connection.ioloop.call_later(self.queue_check_interval, self.check_queue_depth)
+        self.schedule_publish()
+
+    def check_queue_depth(self):
+        if self.finished():
+            return
+        self.channel.queue_declare(queue=self.queue_name, passive=True, callback=self.on_queue_declared)
+        self.connection.ioloop.call_later(self.queue_check_interval, self.check_queue_depth)
+
+    def queue_full(self):
+        # Depth of the last check plus what was published since, the consumers take messages out meanwhile
+        return self.max_queue_depth and self.queue_depth + self.published_since_check >= self.max_queue_depth
+
+    def schedule_publish(self, delay=0):
+        if not self.publish_scheduled:
+            self.publish_scheduled = True
+            self.connection.ioloop.call_later(delay, self.publish)
+
+    def publish(self):
+        self.publish_scheduled = False
+        while (len(self.unconfirmed) < self.window and self.unconfirmed_bytes < self.window_bytes
+               and not self.queue_full()):
+            if self.retry:
+                item = self.retry.pop()
+            elif self.reading_done:
+                break
+            else:
+                try:
+                    item = self.bodies.get_nowait()
+                except queue.Empty:
+                    # The reader thread is behind, look again shortly
+                    self.schedule_publish(0.01)
+                    return
+                if item is None:
+                    self.reading_done = True
+                    break
+                with self.buffer_space:
+                    self.buffered_bytes -= len(item[1])
+                    self.buffer_space.notify()
+            filename, body, content_encoding = item
+            self.channel.basic_publish(exchange='', routing_key=self.queue_name, body=body,
+                                       properties=pika.BasicProperties(delivery_mode=pika.DeliveryMode.Persistent,
+                                                                       content_encoding=content_encoding))
+            self.delivery_tag += 1
+            self.unconfirmed[self.delivery_tag] = item
+            self.unconfirmed_bytes += len(body)
+            self.published_since_check += 1
+
+        if self.finished():
+            self.close()
+        # Otherwise the next confirm or queue depth check continues publishing
+
+    def on_confirm(self, frame):
+        method = frame.method
+        confirmed = []
+        if method.multiple:
+            # unconfirmed is ordered by delivery tag
+            while self.unconfirmed and next(iter(self.unconfirmed)) <= method.delivery_tag:
+                confirmed.append(self.unconfirmed.pop(next(iter(self.unconfirmed))))
+        elif method.delivery_tag in self.unconfirmed:
+            confirmed.append(self.unconfirmed.pop(method.delivery_tag))
+        self.unconfirmed_bytes -= sum(len(body) for _, body, _ in confirmed)
+
+        if isinstance(method, pika.spec.Basic.Ack):
+            self.journal.writelines(filename + '\n' for filename, _, _ in confirmed)
+            self.journal.flush()
+            self.sent += len(confirmed)
+        else:
+            print(f'The broker refused {len(confirmed)} messages, sending them again')
+            self.retry.extend(confirmed)
+        self.schedule_publish()
+
+    def close(self):
+        if not (self.connection.is_closing or self.connection.is_closed):
+            self.connection.close()
+
+    def finished(self):
+        return self.reading_done and not self.unconfirmed and not self.retry
+
+
+def main(yaml_config):
+    """
+    Command line of the producer.py of an app.
+
+    Parameters:
+    yaml_config (String): prod_config.yml of the app
+    """
+    config = load_config(yaml_config)
+    if config:
+        journal_file = os.path.join(os.path.dirname(os.path.abspath(yaml_config)), config['SENT_FILE_LIST'])
+        if not Producer(config, journal_file).run():
+            raise SystemExit(1)
@@ -0,0 +1,280 @@
+"""
+Message handling shared by the RabbitMQ consumers.
+
+The batches never run on the thread of the pika connection: that thread only receives messages,
+answers heartbeats and settles delivery tags, so the connection can use a short heartbeat and a
+dead consumer is noticed by the broker within seconds. Finished batches are acknowledged through
+connection.add_callback_threadsafe.
+
+The consumers collect BATCH_SIZE messages, hand them to the task as one group and acknowledge
+the group with a single basic_ack(multiple=True). A failing message does not fail its batch:
+the batch is retried message by message and only the failing ones are rejected. A message is
+requeued once and dropped (and logged) when it fails again; messages whose outputs could not be
+written (common.sinks.OutputError) and batches the worker pool failed on are always requeued.
+Tasks are decoded by common.messages: inline or claim-check tasks, optionally compressed.
+
+With --workers N the consumer loads its terminology, stopwords and models once and forks N
+worker processes which share that state copy-on-write. The parent keeps the pika connection,
+sends batches to the workers and acknowledges them when the workers are done. One executor can
+serve the batches of several queues, the workers look the task up by queue name.
+
+The pika connection itself is managed by common.consumer.
+"""
+
+import functools
+import gc
+import multiprocessing
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pika.exceptions
+
+from common.messages import decode_task, task_filename
+from common.metrics import ConsumerMetrics, new_batch_stats, resident_memory
+from common.sinks import OutputError
+
+
+def process_bodies(bodies, process_batch, input_folder='', stats=None):
+    """
+    Decode and process the bodies of a group of messages.
+
+    Parameters:
+    bodies (List): (body, content_encoding) of every message
+    process_batch (Function): processes a list of decoded tasks and writes their outputs; it may return
+                              the seconds spent in the 'process' and 'write' stages, its 'cache_hits' and
+                              'cache_misses' and the 'lookups' of its own caches by (cache, result),
+                              otherwise the whole call counts as processing
+    input_folder (String): folder the paths of claim-check tasks are relative to
+    stats (Dict): from common.metrics.new_batch_stats, collects the measurements of the batch
+
+    Returns:
+    Tuple: indexes of the bodies that could not be processed, and those of them whose outputs could not be written
+    """
+    stats = stats if stats is not None else new_batch_stats()
+    start = time.perf_counter()
+    tasks, failed, unwritten = [], [], []
+    for index, (body, content_encoding) in enumerate(bodies):
+        try:
+            tasks.append((index, decode_task(body, input_folder, content_encoding)))
+        except (ValueError, KeyError, OSError):
+            print('Could not decode message {} of the batch'.format(index))
+            traceback.print_exc()
+            failed.append(index)
+            stats['decode_errors'] += 1
+    stats['decode'] += time.perf_counter() - start
+
+    if not tasks:
+        return failed, unwritten
+    start = time.perf_counter()
+    try:
+        stages = process_batch([task for _, task in tasks])
+        if isinstance(stages, dict):
+            stats['process'] += stages.get('process', 0.0)
+            stats['write'] += stages.get('write', 0.0)
+            stats['cache_hits'] += stages.get('cache_hits', 0)
+            stats['cache_misses'] += stages.get('cache_misses', 0)
+            for key, count in stages.get('lookups', {}).items():
+                stats['lookups'][key] = stats['lookups'].get(key, 0) + count
+        else:
+            stats['process'] += time.perf_counter() - start
+        stats['sizes'].extend(len(task['contents']) for _, task in tasks)
+        return failed, unwritten
+    except Exception as e:
+        stats['process'] += time.perf_counter() - start
+        if len(tasks) == 1:
+            print('Could not process task {}'.format(tasks[0][1].get('filename')))
+            traceback.print_exc()
+            failed.append(tasks[0][0])
+            if isinstance(e, OutputError):
+                unwritten.append(tasks[0][0])
+            stats['process_errors'] += 1
+            return failed, unwritten
+
+    # Retry one by one so that only the failing messages are rejected
+    for index, task in tasks:
+        task_failed, task_unwritten = process_bodies([bodies[index]], process_batch, input_folder, stats)
+        if task_failed:
+            failed.append(index)
+        if task_unwritten:
+            unwritten.append(index)
+    return sorted(failed), unwritten
+
+
+# Queue name -> (process_batch, input_folder), set in every worker
+_worker_tasks = {}
+
+
+def _init_worker(tasks):
+    global _worker_tasks
+    _worker_tasks = tasks
+
+
+def _run_batch(queue_name, bodies):
+    """Entry point of the worker threads and processes, returns the failed and unwritten indexes and the measurements."""
+    process_batch, input_folder = _worker_tasks[queue_name]
+    stats = new_batch_stats()
+    failed, unwritten = process_bodies(bodies, process_batch, input_folder, stats)
+    stats.update(pid=os.getpid(), rss=resident_memory(), finished=time.time())
+    return failed, unwritten, stats
+
+
+def create_executor(tasks, workers=1):
+    """
+    Create the pool the batches run in.
+
+    Parameters:
+    tasks (Dict): queue name -> (process_batch, input_folder) of every queue the pool serves
+    workers (Int): number of forked worker processes, 1 processes the batches on a thread of this process
+    """
+    if workers <= 1:
+        # A single worker thread, so process_batch never runs concurrently with itself
+        return ThreadPoolExecutor(1, initializer=_init_worker, initargs=(tasks,))
+    # Everything loaded so far is shared with the workers; keep the garbage collector from touching
+    # (and so copying) those pages in every worker
+    gc.freeze()
+    executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork'),
+                                   initializer=_init_worker, initargs=(tasks,))
+    # The pool forks on its first submit; fork the workers now, before this process opens the broker
+    # connection or starts threads (metrics server, output writers) they must not inherit
+    for future in [executor.submit(os.getpid) for _ in range(workers)]:
+        future.result()
+    return executor
+
+
+class BatchConsumer:
+    """
+    Collects the messages of a queue into batches, processes them inline or in a worker pool and
+    settles their delivery tags on the connection thread.
+    """
+
+    def __init__(self, channel, queue_name, process_batch, batch_size=1, executor=None, batch_timeout=1.0,
+                 prefetch_count=None, input_folder='', metrics=None):
+        """
+        Parameters:
+        channel: pika BlockingChannel with the queue declared
+        queue_name (String): queue to consume from
+        process_batch (Function): processes a list of decoded tasks and writes their outputs
+        batch_size (Int): number of messages processed together
+        executor (concurrent.futures.Executor): from create_executor, None to run the batches on the connection
+                                                thread (blocks heartbeats, only meant for tests and benchmarks)
+        batch_timeout (Float): seconds to wait for more messages before processing an incomplete batch
+        prefetch_count (Int): unacknowledged messages the broker may send, defaults to batch_size
+        input_folder (String): folder the paths of claim-check tasks are relative to
+        metrics (ConsumerMetrics): counters of the queue, kept across reconnections
+        """
+        self.channel = channel
+        self.connection = channel.connection
+        self.queue_name = queue_name
+        self.process_batch = process_batch
+        self.batch_size = max(1, batch_size or 1)
+        self.executor = executor
+        self.batch_timeout = batch_timeout
+        self.prefetch_count = prefetch_count or self.batch_size
+        self.input_folder = input_folder
+        self.metrics = metrics or ConsumerMetrics(queue_name)
+        self.batch = []
+        self.timer = None
+        # Delivery tags received but not yet acknowledged or rejected
+        self.outstanding = set()
+        # Set when the worker pool broke, the process has to be restarted
+        self.broken = False
+
+    def start(self):
+        """Register the consumer, the messages arrive while the connection processes its events."""
+        self.channel.basic_qos(prefetch_count=self.prefetch_count)
+        self.channel.basic_consume(queue=self.queue_name, on_message_callback=self.on_message)
+
+    def on_message(self, channel, method, properties, body):
+        self.outstanding.add(method.delivery_tag)
+        self.metrics.set_in_flight(len(self.outstanding))
+        self.batch.append((method.delivery_tag, method.redelivered, (body, properties.content_encoding)))
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+        elif self.timer is None:
+            self.timer = self.connection.call_later(self.batch_timeout, self.flush)
+
+    def flush(self):
+        if self.timer is not None:
+            self.connection.remove_timeout(self.timer)
+            self.timer = None
+        batch, self.batch = self.batch, []
+        if not batch:
+            return
+
+        bodies = [body for _, _, body in batch]
+        if self.executor is None:
+            stats = new_batch_stats()
+            failed, unwritten = process_bodies(bodies, self.process_batch, self.input_folder, stats)
+            stats['finished'] = time.time()
+            self.settle(batch, failed, stats, requeue=unwritten)
+            return
+        future = self.executor.submit(_run_batch, self.queue_name, bodies)
+        future.add_done_callback(functools.partial(self.on_future_done, batch))
+
+    def on_future_done(self, batch, future):
+        # Done callbacks run on an executor thread, the channel may only be used from the connection thread
+        try:
+            self.connection.add_callback_threadsafe(functools.partial(self.on_batch_done, batch, future))
+        except pika.exceptions.ConnectionWrongStateError:
+            # The connection was lost while the batch ran, the broker redelivers its messages
+            print('Connection closed, dropping the result of a batch of {}'.format(self.queue_name))
+
+    def on_batch_done(self, batch, future):
+        try:
+            failed, unwritten, stats = future.result()
+        except BrokenProcessPool:
+            # A worker died (e.g. killed by the OOM killer), give the messages back and stop this consumer
+            print('Worker pool is broken, requeueing the batch and stopping')
+            for delivery_tag, _, _ in batch:
+                self.outstanding.discard(delivery_tag)
+                self.channel.basic_reject(delivery_tag=delivery_tag, requeue=True)
+            self.metrics.set_in_flight(len(self.outstanding))
+            self.broken = True
+            self.channel.stop_consuming()
+            return
+        except Exception:
+            # E.g. the batch could not be pickled; the messages themselves did not fail, so they are requeued
+            print('Batch of {} failed in the worker pool, requeueing it'.format(self.queue_name))
+            traceback.print_exc()
+            self.settle(batch, range(len(batch)), requeue=range(len(batch)))
+            return
+        self.settle(batch, failed, stats, requeue=unwritten)
+
+    def settle(self, batch, failed, stats=None, requeue=()):
+        """
+        Reject the failed messages of a batch and acknowledge the others.
+
+        A failed message is requeued once; if it fails again after redelivery it is dropped and
+        logged with its filename. The failed messages in requeue are requeued in any case.
+        Batches can finish out of order, so basic_ack(multiple=True) is only used up to the
+        oldest message still in progress, later messages are acknowledged one by one.
+        """
+        failed = set(failed)
+        requeue = set(requeue)
+        succeeded = []
+        for index, (delivery_tag, redelivered, (body, content_encoding)) in enumerate(batch):
+            self.outstanding.discard(delivery_tag)
+            if index in failed:
+                if redelivered and index not in requeue:
+                    print('Dropping message {} of {} (filename {}), it failed again after redelivery'.format(
+                        delivery_tag, self.queue_name, task_filename(body, content_encoding)))
+                self.channel.basic_reject(delivery_tag=delivery_tag, requeue=not redelivered or index in requeue)
+            else:
+                succeeded.append(delivery_tag)
+
+        oldest_in_progress = min(self.outstanding, default=None)
+        covered = [tag for tag in succeeded if oldest_in_progress is None or tag < oldest_in_progress]
+        for delivery_tag in succeeded:
+            if delivery_tag not in covered:
+                self.channel.basic_ack(delivery_tag=delivery_tag)
+        if covered:
+            self.channel.basic_ack(delivery_tag=max(covered), multiple=True)
+
+        stats = stats or new_batch_stats()
+        if 'finished' in stats:
+            stats['ack'] = time.time() - stats['finished']
+        self.metrics.record_batch(len(batch), len(failed), stats)
+        self.metrics.set_in_flight(len(self.outstanding))
@@ -0,0 +1,217 @@
+"""
+Output sinks of the RabbitMQ consumers, selected with OUTPUT_SINK in the prod_config.yml.
+
+files (default): one file per document in OUTPUT_FOLDER, like the consumers always wrote them.
+    The files are written by OUTPUT_WRITERS background threads, at most OUTPUT_BUFFER outputs
+    wait for a thread, and each file is written to a temporary name and renamed, so a reader
+    never sees a partial output. On /mnt/drive the open/close of many small files dominates,
+    the threads overlap that latency.
+jsonl, packed: every process appends its outputs to its own shard in OUTPUT_FOLDER, a new
+    shard is started after SHARD_SIZE bytes. jsonl shards hold one {"filename", "contents"}
+    object per line, packed shards the bare UTF-8 texts. Next to every shard an .index file
+    lists filename, offset and length of each output; load_shard_index and read_shard_output
+    read them back.
+
+Either way flush returns once the outputs of the batch are written, so a batch is only
+acknowledged after its outputs exist. ConsumerTask raises OutputError when they could not be
+written, its messages are requeued instead of rejected.
+
+DiagnosticsLog replaces logs all consumer processes appended to at once: every process writes
+its lines to a file of its own, once per batch.
+"""
+
+import json
+import multiprocessing.util
+import os
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class OutputError(Exception):
+    """The outputs of a batch could not be written, e.g. because the output folder was unavailable."""
+
+
+def write_atomic(path, text, encoding=None):
+    """Write text to path through a temporary file in the same folder, replaced in one step."""
+    folder, name = os.path.split(path)
+    # Unique per writer thread, two outputs of a batch may have the same filename
+    temporary_path = os.path.join(folder, '.{}.{}-{}.tmp'.format(name, os.getpid(), threading.get_ident()))
+    try:
+        with open(temporary_path, 'w', encoding=encoding) as file:
+            file.write(text)
+        os.replace(temporary_path, path)
+    except OSError:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+
+
+class FileSink:
+    """One file per output, written atomically by a pool of background threads."""
+
+    def __init__(self, output_folder, encoding=None, writers=4, buffer_size=64):
+        """
+        Parameters:
+        output_folder (String): folder of the output files, the filename of a task is appended to it
+        encoding (String): encoding of the files, None for the locale encoding
+        writers (Int): number of writer threads
+        buffer_size (Int): outputs that may wait for a writer before write blocks
+        """
+        self.output_folder = output_folder
+        self.encoding = encoding
+        self.writers = max(1, writers)
+        self.buffer_size = max(1, buffer_size)
+        # Threads do not survive a fork, every worker process starts its own
+        self.pid = None
+
+    def start(self):
+        self.pid = os.getpid()
+        self.executor = ThreadPoolExecutor(self.writers)
+        self.slots = threading.BoundedSemaphore(self.buffer_size)
+        self.futures = []
+
+    def write(self, filename, output):
+        if self.pid != os.getpid():
+            self.start()
+        self.slots.acquire()
+        future = self.executor.submit(write_atomic, self.output_folder + filename, output, self.encoding)
+        future.add_done_callback(lambda future: self.slots.release())
+        self.futures.append(future)
+
+    def flush(self):
+        """Wait until everything written so far is on disk, raises the first error of a write."""
+        if self.pid != os.getpid():
+            return
+        futures, self.futures = self.futures, []
+        errors = [future.exception() for future in futures]
+        for error in errors:
+            if error is not None:
+                raise error
+
+
+class ShardSink:
+    """Appends the outputs of this process to a shard with an index of filename, offset and length."""
+
+    def __init__(self, output_folder, prefix, packed=False, shard_size=256 * 1024 * 1024):
+        """
+        Parameters:
+        output_folder (String): folder of the shards
+        prefix (String): first part of the shard names, e.g. the queue name
+        packed (Bool): write the bare texts instead of JSON lines
+        shard_size (Int): bytes after which a new shard is started
+        """
+        self.output_folder = output_folder
+        self.prefix = prefix
+        self.packed = packed
+        self.shard_size = shard_size
+        self.pid = None
+        self.shard = None
+
+    def open_shard(self):
+        if self.shard is not None:
+            self.shard.close()
+            self.index.close()
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.sequence = 0
+        # Shards are opened for appending, a restarted consumer with the same pid continues them
+        path = os.path.join(self.output_folder, '{}-{}-{}-{:05d}{}'.format(
+            self.prefix, socket.gethostname(), self.pid, self.sequence, '.packed' if self.packed else '.jsonl'))
+        self.sequence += 1
+        self.shard = open(path, 'ab')
+        self.index = open(path + '.index', 'a', encoding='utf-8')
+        self.shard_name = os.path.basename(path)
+        self.entries = []
+
+    def write(self, filename, output):
+        if self.pid != os.getpid():
+            # The files of the parent were inherited by the fork, the worker writes its own shards
+            self.shard = None
+            self.open_shard()
+        if self.packed:
+            data = output.encode('utf-8')
+        else:
+            data = (json.dumps({'filename': filename, 'contents': output}) + '\n').encode('utf-8')
+        offset = self.shard.tell()
+        self.shard.write(data)
+        self.entries.append('{}\t{}\t{}\n'.format(filename, offset, len(data)))
+
+    def flush(self):
+        if self.pid != os.getpid() or self.shard is None:
+            return
+        # The index is only written once the data it points to is
+        self.shard.flush()
+        self.index.writelines(self.entries)
+        self.index.flush()
+        self.entries = []
+        if self.shard.tell() >= self.shard_size:
+            self.open_shard()
+
+
+def load_shard_index(output_folder):
+    """
+    Read the indexes of all shards of a folder.
+
+    Returns:
+    Dict: filename -> (shard path, offset, length); of outputs written more than once the latest is kept
+    """
+    entries = {}
+    for index_name in sorted(os.listdir(output_folder)):
+        if not index_name.endswith('.index'):
+            continue
+        shard_path = os.path.join(output_folder, index_name[:-len('.index')])
+        with open(os.path.join(output_folder, index_name), encoding='utf-8') as index:
+            for line in index:
+                filename, offset, length = line.rstrip('\n').rsplit('\t', 2)
+                entries[filename] = (shard_path, int(offset), int(length))
+    return entries
+
+
+def read_shard_output(entry):
+    """Read one output of load_shard_index back."""
+    shard_path, offset, length = entry
+    with open(shard_path, 'rb') as shard:
+        shard.seek(offset)
+        data = shard.read(length)
+    if shard_path.endswith('.packed'):
+        return data.decode('utf-8')
+    return json.loads(data)['contents']
+
+
+def create_sink(config, output_folder, encoding=None):
+    """Create the sink selected by OUTPUT_SINK."""
+    sink = config.get('OUTPUT_SINK', 'files')
+    if sink == 'files':
+        return FileSink(output_folder, encoding, config.get('OUTPUT_WRITERS', 4), config.get('OUTPUT_BUFFER', 64))
+    if sink in ('jsonl', 'packed'):
+        return ShardSink(output_folder, config.get('QUEUE_NAME') or 'output', sink == 'packed',
+                         config.get('SHARD_SIZE', 256 * 1024 * 1024))
+    raise ValueError('Unknown OUTPUT_SINK {}, use files, jsonl or packed'.format(sink))
+
+
+class DiagnosticsLog:
+    """
+    Log of one process: path + .<host>-<pid>, instead of every instance appending to one shared
+    file. Lines are buffered until flush, which the task calls before its batch is acknowledged;
+    the file is closed when the process exits, also on SIGHUP and SIGTERM (see common.consumer.serve).
+    """
+
+    def __init__(self, path, buffer_size=1024 * 1024):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.pid = None
+        self.file = None
+
+    def write(self, text):
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.file = open('{}.{}-{}'.format(self.path, socket.gethostname(), self.pid), 'a',
+                             encoding='utf-8', buffering=self.buffer_size)
+            # Worker processes do not run atexit handlers, but they do run multiprocessing finalizers
+            multiprocessing.util.Finalize(self, self.file.close, exitpriority=10)
+        self.file.write(text)
+
+    def flush(self):
+        if self.pid == os.getpid():
+            self.file.flush()
@@ -0,0 +1,28 @@
+"""
+Stopwords of the consumers: the NLTK stopwords extended by the stopword files of the config.
+"""
+
+import nltk
+from nltk.corpus import stopwords
+
+
+def load_stopwords(stopwords_list, file_path):
+    stopwords_set = set(stopwords_list)
+    with open(file_path, encoding='utf-8') as f:
+        stopwords_set.update(f.read().split())
+    return stopwords_set
+
+
+def load_stop_words(config):
+    """
+    Load the German and English stopwords.
+
+    Parameters:
+    config (Dict): prod_config.yml with STOP_WORDS_DE_FILE and STOP_WORDS_EN_FILE
+
+    Returns:
+    Tuple: (German stopwords, English stopwords)
+    """
+    nltk.download('stopwords')
+    return (load_stopwords(stopwords.words('german'), config['STOP_WORDS_DE_FILE']),
+            load_stopwords(stopwords.words('english'), config['STOP_WORDS_EN_FILE']))
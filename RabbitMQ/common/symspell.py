@@ -0,0 +1,265 @@
+"""
+Symmetric-delete spelling correction for the dictionary filters, SPELL_BACKEND: symspell.
+
+pyspellchecker finds corrections by generating every string at edit distance 1 and 2 of a word
+and looking them up, for a long German compound millions of strings per word. DeleteIndex makes
+the same decisions from a precomputed index: every dictionary word is stored under the strings
+that remain of its first PREFIX_LENGTH characters after deleting up to two of them. A word with a
+dictionary word within two edits shares one of these delete strings with it, so a lookup only
+has to generate the deletes of the word and verify the few words stored under them with the
+Damerau-Levenshtein distance.
+
+correction and known_neighbour follow pyspellchecker (SpellChecker.correction and
+known(edit_distance_1(word))) with distance 2: a known word is its own correction, otherwise the
+most frequent dictionary word at distance 1 or else 2 wins, words that only differ in diacritics
+first. Of equally frequent words the alphabetically first is chosen, where pyspellchecker takes
+whichever its set yields first.
+
+The index is built from the dictionary of common.dictionary.load_spell_checker (the pyspellchecker
+languages plus the word list) and memory-mapped, all consumers of a host share its pages. Like the
+terminology index it records the version of the dictionary it was built from and is rebuilt when
+that changes.
+
+Build step:
+python3 symspell.py <word list> [index_file]
+"""
+
+import array
+import os
+import string
+import sys
+import unicodedata
+import zlib
+
+import numpy as np
+
+if __name__ == '__main__':
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.mmapindex import read_index, string_at, string_table, write_index
+
+INDEX_MAGIC = b'TRENDTF-SYMDEL\0\0'
+INDEX_VERSION = 1
+INDEX_SUFFIX = '.symdel'
+
+MAX_DISTANCE = 2
+# Only the deletes of the first characters are indexed, which bounds the index for long compounds
+PREFIX_LENGTH = 7
+
+
+def delete_strings(word, distance=MAX_DISTANCE):
+    """The strings that remain of the prefix of word after deleting up to distance characters."""
+    prefix = word[:PREFIX_LENGTH]
+    deletes = {prefix}
+    frontier = {prefix}
+    for _ in range(distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        deletes |= frontier
+    return deletes
+
+
+def delete_hash(delete):
+    # Collisions only add candidates, which the distance check removes again
+    return zlib.crc32(delete.encode('utf-8', 'surrogatepass'))
+
+
+def damerau_levenshtein(a, b):
+    """Edit distance with insertions, deletions, substitutions and transpositions of adjacent characters."""
+    last_row = {}
+    maximum = len(a) + len(b)
+    rows = [[maximum] * (len(b) + 2)]
+    rows += [[maximum] + list(range(len(b) + 1))]
+    for i in range(1, len(a) + 1):
+        row = [maximum, i] + [0] * len(b)
+        last_match = 0
+        for j in range(1, len(b) + 1):
+            k = last_row.get(b[j - 1], 0)
+            l = last_match
+            cost = 1
+            if a[i - 1] == b[j - 1]:
+                cost = 0
+                last_match = j
+            row[j + 1] = min(rows[i][j] + cost, row[j] + 1, rows[i][j + 1] + 1,
+                             rows[k][l] + (i - k - 1) + 1 + (j - l - 1))
+        rows.append(row)
+        last_row[a[i - 1]] = i
+    return rows[len(a) + 1][len(b) + 1]
+
+
+def remove_diacritics(word):
+    nfkd_form = unicodedata.normalize("NFKD", word)
+    return "".join([c for c in nfkd_form if not unicodedata.combining(c)])
+
+
+def should_check(word, longest_word_length):
+    """pyspellchecker's filter of words it does not correct: punctuation, numbers and overlong words."""
+    if len(word) == 1 and word in string.punctuation:
+        return False
+    if len(word) > longest_word_length + 3:
+        return False
+    if word.lower() in ("nan", "inf", "infinity"):
+        return True
+    try:
+        float(word)
+        return False
+    except ValueError:
+        pass
+    return True
+
+
+class DeleteIndex:
+    """Read-only view of a delete index file, used in place of a SpellChecker by common.dictionary."""
+
+    def __init__(self, file_path):
+        self.index = read_index(file_path, INDEX_MAGIC, INDEX_VERSION)
+        self.header = self.index.header
+        for name, section in self.index.sections.items():
+            setattr(self, name, section)
+
+        self.frequencies = np.frombuffer(self.frequencies, dtype=np.int64)
+        self.delete_keys = np.frombuffer(self.delete_keys, dtype=np.uint32)
+        self.delete_words = np.frombuffer(self.delete_words, dtype=np.uint32)
+        self.longest_word_length = self.header['longest_word_length']
+
+    def close(self):
+        """Unmap the index file, the index cannot be used afterwards."""
+        self.frequencies = self.delete_keys = self.delete_words = None
+        self.index.close()
+
+    def word(self, index):
+        return string_at(self.word_text, self.word_offsets, index)
+
+    def within(self, word, distance):
+        """Dictionary words within distance of the (lower-cased) word, as {word: distance}."""
+        keys = np.array(sorted(delete_hash(delete) for delete in delete_strings(word, distance)), dtype=np.uint32)
+        starts = np.searchsorted(self.delete_keys, keys, 'left')
+        ends = np.searchsorted(self.delete_keys, keys, 'right')
+        indexes = set()
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            indexes.update(self.delete_words[start:end].tolist())
+
+        found = {}
+        for index in indexes:
+            candidate = self.word(index)
+            if abs(len(candidate) - len(word)) > distance:
+                continue
+            candidate_distance = 0 if candidate == word else damerau_levenshtein(word, candidate)
+            if candidate_distance <= distance:
+                found[candidate] = candidate_distance
+        return found
+
+    def frequency(self, word):
+        return self.frequencies[self.index_of(word)]
+
+    def index_of(self, word):
+        # The words are stored sorted
+        lo, hi = 0, len(self.frequencies)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.word(mid) < word:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def correction(self, word):
+        """The most probable correct spelling of the word, None if there is none within two edits."""
+        lower_word = word.lower()
+        if not should_check(lower_word, self.longest_word_length):
+            return word
+        found = self.within(lower_word, MAX_DISTANCE)
+        if lower_word in found:
+            # A correct word is kept as it is written
+            return word
+        candidates = [candidate for candidate, distance in found.items() if distance == 1]
+        if not candidates:
+            candidates = list(found)
+        if not candidates:
+            return None
+        # Prefer exact matches with incorrect diacritics
+        word_no_accents = remove_diacritics(word)
+        diacritics_candidates = [c for c in candidates if remove_diacritics(c) == word_no_accents]
+        candidates = diacritics_candidates or candidates
+        return min(candidates, key=lambda candidate: (-self.frequency(candidate), candidate))
+
+    def known_neighbour(self, word):
+        """Whether a dictionary word is within one edit of the word (the word itself included)."""
+        lower_word = word.lower()
+        if not should_check(lower_word, self.longest_word_length):
+            return False
+        return bool(self.within(lower_word, 1))
+
+
+def build_delete_index(spell, version, index_file):
+    """
+    Build the delete index of the dictionary of a SpellChecker.
+
+    Parameters:
+    spell (SpellChecker): from common.dictionary.load_spell_checker
+    version (String): version of the dictionary, from common.dictionary.dictionary_version
+    index_file (String): path of the index
+
+    Returns:
+    String: path of the written index
+    """
+    longest_word_length = spell.word_frequency.longest_word_length
+    # Words pyspellchecker never returns as known are left out
+    words = sorted(word for word in spell.word_frequency.dictionary if should_check(word, longest_word_length))
+    keys = array.array('I')
+    word_ids = array.array('I')
+    for index, word in enumerate(words):
+        for delete in delete_strings(word):
+            keys.append(delete_hash(delete))
+            word_ids.append(index)
+    keys = np.frombuffer(keys, dtype=np.uint32)
+    order = np.argsort(keys, kind='stable')
+
+    word_offsets, word_text = string_table(words)
+    arrays = {
+        'frequencies': array.array('q', (spell.word_frequency.dictionary[word] for word in words)),
+        'word_offsets': word_offsets, 'word_text': word_text,
+        'delete_keys': array.array('I', keys[order].tobytes()),
+        'delete_words': array.array('I', np.frombuffer(word_ids, dtype=np.uint32)[order].tobytes()),
+    }
+
+    header = {
+        'version': version,
+        'byteorder': sys.byteorder,
+        'words': len(words),
+        'longest_word_length': longest_word_length,
+        'prefix_length': PREFIX_LENGTH,
+    }
+    return write_index(index_file, INDEX_MAGIC, INDEX_VERSION, header, arrays)
+
+
+def load_delete_index(wordlist_file, index_file=None):
+    """
+    Memory-map the delete index of the dictionary with a word list, (re)building it first if it
+    is missing or was built from a different dictionary, byte order or index version.
+
+    Returns:
+    DeleteIndex: the loaded index
+    """
+    from common.dictionary import dictionary_version, load_spell_checker
+
+    index_file = index_file or wordlist_file + INDEX_SUFFIX
+    version = dictionary_version(wordlist_file)
+    if os.path.exists(index_file):
+        try:
+            index = DeleteIndex(index_file)
+            if (index.header['version'] == version and index.header['byteorder'] == sys.byteorder
+                    and index.header['prefix_length'] == PREFIX_LENGTH):
+                return index
+            index.close()
+            print(f"Delete index {index_file} is outdated, rebuilding it")
+        except (ValueError, KeyError) as e:
+            print(f"Could not read delete index {index_file}: {e}, rebuilding it")
+    build_delete_index(load_spell_checker(wordlist_file), version, index_file)
+    return DeleteIndex(index_file)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    index = load_delete_index(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
+    print('{} words in {}'.format(index.header['words'], index.index.mm.size()))
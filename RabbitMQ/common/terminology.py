@@ -0,0 +1,329 @@
+"""
+Terminology handling for the keyphrase consumers.
+
+The consumers used to run re.findall(r'\\b<pilot>\\b', content) once for every pilot of the
+TermSuite terminology. TerminologyMatcher counts every pilot in a single scan of the document,
+with the same word boundary rules, using a character trie stored in flat arrays.
+
+The TSV terminology is compiled once into a binary index (pilots, prepilots, lemmas, freq, spec,
+IDF and the matcher trie) which the consumers memory-map on start. The index records the SHA-256
+of the TSV it was built from and is only rebuilt when the TSV or the corpus size changes.
+The numeric columns are exposed as NumPy arrays, so scoring a document is a vector operation
+over its term frequencies and top_k replaces the full sort of all pilots.
+
+Build step:
+python3 terminology.py <terminology.tsv> <number_of_documents_in_corpus> [index_file]
+"""
+
+import array
+import bisect
+import csv
+import hashlib
+import math
+import os
+import re
+import sys
+
+import numpy as np
+
+if __name__ == '__main__':
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.mmapindex import read_index, string_at, string_table, write_index
+
+BOUNDARY = re.compile(r'\b')
+
+INDEX_MAGIC = b'TRENDTF-TERMS\0\0\0'
+INDEX_VERSION = 1
+INDEX_SUFFIX = '.idx'
+
+
+def load_terminology(file_path):
+    terminology = {}
+    with open(file_path, encoding='latin-1') as f:
+        reader = csv.DictReader(f, delimiter='\t')
+        for row in reader:
+            prepilot = row['pilot'].lower()
+            pilot_lemma = row['lemma']
+            pilot_freq = int(row['freq'])
+            pilot_spec = float(row['spec'].replace(',','.'))
+            terminology[row['pilot']] = {'prepilot': prepilot, 'lemma': pilot_lemma, 'freq': pilot_freq, 'spec': pilot_spec}
+    return terminology
+
+
+class TerminologyMatcher:
+    """
+    Counts the occurrences of all pilots of a terminology in one pass over a document.
+
+    Matches start and end at the same positions where the regex word boundary \\b matches,
+    and every pilot is counted without overlapping itself, exactly like re.findall does.
+
+    The trie is kept in flat arrays so that it can be stored in the terminology index and
+    used straight from the memory-mapped file: the children of node n are the edges
+    edge_start[n] to edge_start[n + 1], sorted by character code.
+    """
+
+    def __init__(self, edge_start, edge_chars, edge_targets, node_patterns, pilot_patterns):
+        self.edge_start = edge_start
+        self.edge_chars = edge_chars
+        self.edge_targets = edge_targets
+        self.node_patterns = node_patterns
+        self.pilot_patterns = pilot_patterns
+        self.number_of_patterns = max(node_patterns) + 1 if len(node_patterns) else 0
+        # Most walks end at the first character, so the children of the root are looked up in a dict
+        self.root_children = {chr(edge_chars[edge]): edge_targets[edge] for edge in range(edge_start[0], edge_start[1])}
+        # Only boundaries followed by the first character of some pilot can start a match
+        if node_patterns[0] >= 0 or not self.root_children:
+            self.starts = BOUNDARY
+        else:
+            self.starts = re.compile(r'\b(?=[{}])'.format(''.join(re.escape(char) for char in sorted(self.root_children))))
+
+    @classmethod
+    def build(cls, prepilots):
+        """
+        Build the trie for a list of lower-cased pilots.
+
+        Parameters:
+        prepilots (List): prepilot of every pilot, in terminology order
+        """
+        children = [{}]
+        patterns = [-1]
+        pattern_ids = {}
+        pilot_patterns = array.array('I')
+        for prepilot in prepilots:
+            if prepilot not in pattern_ids:
+                pattern_ids[prepilot] = len(pattern_ids)
+                node = 0
+                for char in prepilot:
+                    child = children[node].get(ord(char))
+                    if child is None:
+                        child = len(children)
+                        children[node][ord(char)] = child
+                        children.append({})
+                        patterns.append(-1)
+                    node = child
+                patterns[node] = pattern_ids[prepilot]
+            pilot_patterns.append(pattern_ids[prepilot])
+
+        edge_start = array.array('I', [0])
+        edge_chars = array.array('I')
+        edge_targets = array.array('I')
+        for node_children in children:
+            for code in sorted(node_children):
+                edge_chars.append(code)
+                edge_targets.append(node_children[code])
+            edge_start.append(len(edge_chars))
+        return cls(edge_start, edge_chars, edge_targets, array.array('i', patterns), pilot_patterns)
+
+    def count_patterns(self, content):
+        """
+        Count the occurrences of every distinct prepilot in the (already lower-cased) content.
+
+        Returns:
+        List: number of matches for each pattern id
+        """
+        is_boundary = {match.start() for match in BOUNDARY.finditer(content)}
+        starts = [match.start() for match in self.starts.finditer(content)]
+        length = len(content)
+        edge_start = self.edge_start
+        edge_chars = self.edge_chars
+        edge_targets = self.edge_targets
+        node_patterns = self.node_patterns
+        root_children = self.root_children
+        hits = [0] * self.number_of_patterns
+        last_end = [-1] * self.number_of_patterns
+
+        for start in starts:
+            node = 0
+            position = start
+            while True:
+                pattern = node_patterns[node]
+                # A pilot only counts if it ends on a word boundary and does not overlap its previous match
+                if pattern >= 0 and position in is_boundary and start >= last_end[pattern]:
+                    hits[pattern] += 1
+                    last_end[pattern] = position
+                if position == length:
+                    break
+                if node == 0:
+                    node = root_children.get(content[position])
+                    if node is None:
+                        break
+                else:
+                    code = ord(content[position])
+                    lo = edge_start[node]
+                    hi = edge_start[node + 1]
+                    edge = bisect.bisect_left(edge_chars, code, lo, hi)
+                    if edge == hi or edge_chars[edge] != code:
+                        break
+                    node = edge_targets[edge]
+                position += 1
+        return hits
+
+    def count(self, content):
+        """
+        Count the occurrences of every pilot in the (already lower-cased) content.
+
+        Returns:
+        List: number of matches of each pilot, in terminology order
+        """
+        hits = self.count_patterns(content)
+        return [hits[pattern] for pattern in self.pilot_patterns]
+
+
+class TerminologyIndex:
+    """
+    Read-only view of a terminology index file. The arrays are memoryviews (matcher, strings)
+    and NumPy arrays (freq, spec, idf) on the memory-mapped file, so all consumers on a host
+    share the same pages.
+    """
+
+    def __init__(self, file_path):
+        self.index = read_index(file_path, INDEX_MAGIC, INDEX_VERSION)
+        self.header = self.index.header
+        for name, section in self.index.sections.items():
+            setattr(self, name, section)
+
+        self.freq = np.frombuffer(self.freq, dtype=np.int64)
+        self.spec = np.frombuffer(self.spec, dtype=np.float64)
+        self.idf = np.frombuffer(self.idf, dtype=np.float64)
+        self.pilot_pattern_ids = np.frombuffer(self.pilot_patterns, dtype=np.uint32)
+
+        self.number_of_pilots = self.header['pilots']
+        self.number_of_documents = self.header['number_of_documents']
+        self.matcher = TerminologyMatcher(self.edge_start, self.edge_chars, self.edge_targets,
+                                          self.node_patterns, self.pilot_patterns)
+
+    def __len__(self):
+        return self.number_of_pilots
+
+    def close(self):
+        """Unmap the index file, the index cannot be used afterwards."""
+        self.freq = self.spec = self.idf = self.pilot_pattern_ids = self.matcher = None
+        self.index.close()
+
+    def term_frequencies(self, content):
+        """
+        Count the occurrences of every pilot in the (already lower-cased) content.
+
+        Returns:
+        numpy.ndarray: number of matches of each pilot, in terminology order
+        """
+        hits = np.array(self.matcher.count_patterns(content), dtype=np.int64)
+        return hits[self.pilot_pattern_ids]
+
+    def pilot(self, index):
+        return string_at(self.pilot_text, self.pilot_offsets, index)
+
+    def prepilot(self, index):
+        return string_at(self.prepilot_text, self.prepilot_offsets, index)
+
+    def lemma(self, index):
+        return string_at(self.lemma_text, self.lemma_offsets, index)
+
+
+def top_k(scores, k):
+    """
+    Select the k highest scores without sorting all of them.
+
+    Equal scores keep their terminology order, so the result is exactly the first k entries of
+    sorted(range(len(scores)), key=scores.__getitem__, reverse=True).
+
+    Parameters:
+    scores (numpy.ndarray): score of every pilot
+    k (Int): number of pilots to select
+
+    Returns:
+    numpy.ndarray: indices of the selected pilots, highest score first
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    if k == len(scores):
+        return np.argsort(-scores, kind='stable')
+    threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+    above = np.flatnonzero(scores > threshold)
+    ties = np.flatnonzero(scores == threshold)[:k - len(above)]
+    selected = np.concatenate((above, ties))
+    return selected[np.argsort(-scores[selected], kind='stable')]
+
+
+def file_sha256(file_path):
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def build_terminology_index(terminology_file, number_of_documents_in_corpus, index_file=None):
+    """
+    Compile a TermSuite TSV into a terminology index file.
+
+    Parameters:
+    terminology_file (String): path of the TSV terminology
+    number_of_documents_in_corpus (Int): corpus size used for the precomputed IDF
+    index_file (String): path of the index, defaults to the TSV path with the .idx suffix
+
+    Returns:
+    String: path of the written index
+    """
+    index_file = index_file or terminology_file + INDEX_SUFFIX
+    source_sha256 = file_sha256(terminology_file)
+    terminology = load_terminology(terminology_file)
+    pilots = list(terminology)
+    entries = [terminology[pilot] for pilot in pilots]
+    matcher = TerminologyMatcher.build([entry['prepilot'] for entry in entries])
+
+    pilot_offsets, pilot_text = string_table(pilots)
+    prepilot_offsets, prepilot_text = string_table(entry['prepilot'] for entry in entries)
+    lemma_offsets, lemma_text = string_table(entry['lemma'] for entry in entries)
+    arrays = {
+        'freq': array.array('q', (entry['freq'] for entry in entries)),
+        'spec': array.array('d', (entry['spec'] for entry in entries)),
+        'idf': array.array('d', (math.log(number_of_documents_in_corpus / entry['freq']) for entry in entries)),
+        'pilot_offsets': pilot_offsets, 'pilot_text': pilot_text,
+        'prepilot_offsets': prepilot_offsets, 'prepilot_text': prepilot_text,
+        'lemma_offsets': lemma_offsets, 'lemma_text': lemma_text,
+        'edge_start': matcher.edge_start, 'edge_chars': matcher.edge_chars, 'edge_targets': matcher.edge_targets,
+        'node_patterns': matcher.node_patterns, 'pilot_patterns': matcher.pilot_patterns,
+    }
+
+    header = {
+        'source': os.path.abspath(terminology_file),
+        'source_sha256': source_sha256,
+        'number_of_documents': number_of_documents_in_corpus,
+        'byteorder': sys.byteorder,
+        'pilots': len(pilots),
+    }
+    return write_index(index_file, INDEX_MAGIC, INDEX_VERSION, header, arrays)
+
+
+def load_terminology_index(terminology_file, number_of_documents_in_corpus, index_file=None):
+    """
+    Memory-map the index of a TSV terminology, (re)building it first if it is missing or
+    was built from a different TSV, corpus size, byte order or index version.
+
+    Returns:
+    TerminologyIndex: the loaded index
+    """
+    index_file = index_file or terminology_file + INDEX_SUFFIX
+    if os.path.exists(index_file):
+        try:
+            index = TerminologyIndex(index_file)
+            header = index.header
+            if (header['source_sha256'] == file_sha256(terminology_file)
+                    and header['number_of_documents'] == number_of_documents_in_corpus
+                    and header['byteorder'] == sys.byteorder):
+                return index
+            index.close()
+            print(f"Terminology index {index_file} is outdated, rebuilding it")
+        except (ValueError, KeyError) as e:
+            print(f"Could not read terminology index {index_file}: {e}, rebuilding it")
+    build_terminology_index(terminology_file, number_of_documents_in_corpus, index_file)
+    return TerminologyIndex(index_file)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+    print('Written', build_terminology_index(sys.argv[1], int(sys.argv[2]), sys.argv[3] if len(sys.argv) > 3 else None))
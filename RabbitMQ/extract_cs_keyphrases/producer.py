@@ -0,0 +1,11 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.producer import main
+
+if __name__ == '__main__':
+
+    #Define yaml config file, the prod_config.yml next to this script
+    yaml_config = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'prod_config.yml')
+    main(yaml_config)
@@ -1,72 +1,76 @@
-import pika
 import json
-import yaml
-import spacy
 from nltk.tokenize import word_tokenize
 import os
-import nltk
-nltk.download('stopwords')
-from nltk.corpus import stopwords
-
-QUEUE_NAME = None
-BATCH_SIZE = None
-RABBITMQ_HOST = None
-RABBITMQ_PORT = None
-RABBITMQ_USER = None
-RABBITMQ_PASS = None
-OUTPUT_FOLDER = ''
-metadata_dir = "/mnt/drive/metadata/ExtractedMetaDataJson/ExtractedMetaDataJson/"
-# Load the appropriate spacy model for each language
-nlp_en = spacy.load("en_core_web_sm")
-nlp_de = spacy.load("de_core_news_sm")
-stop_words_de_file = '/mnt/drive/RabbitMQ/extract_cs_keyphrases/german_stopwords_extention.txt'
-stop_words_en_file = '/mnt/drive/RabbitMQ/extract_cs_keyphrases/english_stopwords_extention.txt'
-
-def load_stopwords(stopwords_list, file_path):
-    stopwords_set = set(stopwords_list)
-    with open(file_path, encoding='utf-8') as f:
-        stopwords_set.update(f.read().split())
-    return stopwords_set
-
-STOP_WORDS_DE = load_stopwords(stopwords.words('german'), stop_words_de_file)
-STOP_WORDS_EN = load_stopwords(stopwords.words('english'), stop_words_en_file)
-
-def load_config(filename):
-    try:
-        with open(filename, 'r') as file:
-            config = yaml.safe_load(file)
-    except FileNotFoundError:
-        print(f"Could not find {filename}.")
-        return {}
-
-    return config
-
-def set_config_vars(config):
-    global QUEUE_NAME, BATCH_SIZE, RABBITMQ_HOST, RABBITMQ_PORT, RABBITMQ_USER, RABBITMQ_PASS, OUTPUT_FOLDER
-    QUEUE_NAME = config.get('QUEUE_NAME', QUEUE_NAME)
-    BATCH_SIZE = config.get('BATCH_SIZE', BATCH_SIZE)
-    RABBITMQ_HOST = config.get('RABBITMQ_HOST', RABBITMQ_HOST)
-    RABBITMQ_PORT = config.get('RABBITMQ_PORT', RABBITMQ_PORT)
-    RABBITMQ_USER = config.get('RABBITMQ_USER', RABBITMQ_USER)
-    RABBITMQ_PASS = config.get('RABBITMQ_PASS', RABBITMQ_PASS)
-    OUTPUT_FOLDER = config.get('OUTPUT_FOLDER', OUTPUT_FOLDER)
-
-def connect_to_queue():
-    # Establish connection to RabbitMQ server
-    credentials = pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASS)
-    connection = pika.BlockingConnection(pika.ConnectionParameters(
-        host=RABBITMQ_HOST, port=RABBITMQ_PORT, credentials=credentials))
-
-    channel = connection.channel()
-    # Create a queue for receiving tasks from distributor
-    channel.queue_declare(queue=QUEUE_NAME, durable=True)
-
-    return channel
-
-def lemmatize(filename, content):
-    # Determine the name of the corresponding JSON file
-        json_filename = os.path.splitext(filename)[0] + ".json"
-        json_path = os.path.join(metadata_dir, json_filename)
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.cache import TokenCache
+from common.consumer import ConsumerTask, main
+from common.languages import LanguageIndex, update_language_index
+from common.lemmas import Lemmatizer, load_model
+from common.stopwords import load_stop_words
+from common.terminology import file_sha256
+
+
+class LemmaTask(ConsumerTask):
+    """Writes the lemmas of every word of a document that is neither a proper noun nor a stopword."""
+
+    output_encoding = 'utf-8'
+
+    def setup(self):
+        self.metadata_dir = self.config['METADATA_FOLDER']
+        # Look the languages up in the index, brought up to date before the workers start
+        self.languages = None
+        if self.config.get('LANGUAGE_INDEX'):
+            update_language_index(self.metadata_dir, self.config['LANGUAGE_INDEX'])
+            self.languages = LanguageIndex(self.config['LANGUAGE_INDEX'])
+        # Load the appropriate spacy model for each language
+        self.nlp_en = load_model(self.config.get('SPACY_MODEL_EN', 'en_core_web_sm'))
+        self.nlp_de = load_model(self.config.get('SPACY_MODEL_DE', 'de_core_news_sm'))
+        self.stop_words_de, self.stop_words_en = load_stop_words(self.config)
+        self.lemma_cache = None
+        if self.config.get('LEMMA_CACHE_SIZE'):
+            self.lemma_cache = TokenCache(self.config['LEMMA_CACHE_SIZE'], self.config.get('LEMMA_CACHE_FILE'),
+                                          self.config.get('LEMMA_CACHE_FILE_SIZE', 1000000))
+        self.lemmatizers = {nlp: Lemmatizer(nlp, self.stop_words_de, self.stop_words_en,
+                                            self.config.get('LEMMA_CHUNK_WORDS', 5000),
+                                            self.config.get('SPACY_BATCH_SIZE', 32),
+                                            self.config.get('SPACY_PROCESSES', 1),
+                                            self.lemma_cache, language)
+                            for language, nlp in (('de', self.nlp_de), ('en', self.nlp_en))}
+
+    def result_version(self):
+        # The components and, for words tagged in context, the chunk size change the lemmas
+        return '{} models {} {} {} stopwords {} {}'.format(
+            super().result_version(),
+            *('{}-{}({})'.format(nlp.meta['name'], nlp.meta['version'], '+'.join(nlp.pipe_names))
+              for nlp in (self.nlp_de, self.nlp_en)),
+            'per word' if self.lemma_cache is not None
+            else 'chunks {}'.format(self.lemmatizers[self.nlp_de].chunk_size),
+            file_sha256(self.config['STOP_WORDS_DE_FILE']), file_sha256(self.config['STOP_WORDS_EN_FILE']))
+
+    def cache_lookups(self):
+        if self.lemma_cache is None:
+            return {}
+        return {('lemma', result): count for result, count in self.lemma_cache.take_lookups().items()}
+
+    def cache_document(self, task):
+        # The model is chosen by the language in the metadata of the document
+        return '{}\0{}'.format(self.document_language(task['filename']), task['contents'])
+
+    def document_language(self, filename):
+        ppn = os.path.splitext(filename)[0]
+        if self.languages is not None:
+            try:
+                # German only if the metadata has no language, like below
+                return self.languages.language(ppn, "de")
+            except KeyError:
+                # Metadata written since the index was updated
+                pass
+
+        # Determine the name of the corresponding JSON file
+        json_filename = ppn + ".json"
+        json_path = os.path.join(self.metadata_dir, json_filename)
 
         # Load the metadata for the file from the JSON file
         try:
@@ -76,67 +80,35 @@ def lemmatize(filename, content):
             metadata = {"language": {"language": "de"}}
 
         # Determine the language of the content
-        language = metadata.get("language", {}).get("language", "de")
-
-        # Load the appropriate spacy model for the language
-        if language == "de":
-            nlp = nlp_de
-        else:
-            nlp = nlp_en
-            
-        # Tokenize the content into words
-        words = word_tokenize(content)
-
-        # Lemmatize each word using the appropriate spacy model
-        lemmatized_words = []
-        for word in words:
-            # Ignore proper nouns (PROPN)
-            doc = nlp(word)
-            if doc[0].pos_ != "PROPN":
-                # Check if the word is not a stopword in both STOP_WORDS_DE and STOP_WORDS_EN
-                if word.lower() not in STOP_WORDS_DE and word.lower() not in STOP_WORDS_EN:
-                    lemma = doc[0].lemma_
-                    lemmatized_words.append(lemma)
-                    
-        # Join the lemmatized words back into a string
-        lemmatized_content = " ".join(lemmatized_words)
-        return lemmatized_content
-
-# Define the callback function to handle incoming messages
-def callback(ch, method, properties, body):
-    # Decode the JSON object from the message body
-    task = json.loads(body.decode('utf-8'))
-    filename = task['filename']
-    contents = task['contents']
-
-    # Print the task to the console
-    """WRITE YOUR TASK HERE OR REFER IT FROM ANOTHER FILE
-    As an example the code is just priting the filename
-	"""
-    print(f"Received task {filename} from distributor")
-
-    lemmas = lemmatize(filename, contents)
-    # Save the contents to a file with the specified filename
-    with open(OUTPUT_FOLDER + filename, 'w', encoding="utf-8") as file:
-        file.write(lemmas)
-
-    # Acknowledge the message to remove it from the queue
-    ch.basic_ack(delivery_tag=method.delivery_tag)
-
-def start_consuming():
-    # Start consuming messages from the queue
-    channel = connect_to_queue()
-    channel.basic_qos(prefetch_count=1)
-    channel.basic_consume(queue=QUEUE_NAME, on_message_callback=callback)
-
-    print('Waiting for tasks...')
-    channel.start_consuming()
+        return metadata.get("language", {}).get("language", "de")
+
+    def lemmatize(self, filename, content):
+        return self.lemmatize_batch([(filename, content)])[0]
+
+    def lemmatize_batch(self, documents):
+        # Tokenize the content of every document into words
+        words = [word_tokenize(content) for _, content in documents]
+
+        # Load the appropriate spacy model for the language of every document
+        models = [self.nlp_de if self.document_language(filename) == "de" else self.nlp_en for filename, _ in documents]
+
+        lemmatized_contents = [None] * len(documents)
+        for nlp, lemmatizer in self.lemmatizers.items():
+            indexes = [i for i, model in enumerate(models) if model is nlp]
+
+            # Lemmatize the documents in this language together, in chunks of whole sentences
+            for i, lemmatized_content in zip(indexes, lemmatizer.lemmatize_words([words[i] for i in indexes])):
+                lemmatized_contents[i] = lemmatized_content
+        return lemmatized_contents
+
+    def process_batch(self, tasks):
+        return self.lemmatize_batch([(task['filename'], task['contents']) for task in tasks])
+
+
+TASK = LemmaTask
 
 if __name__ == '__main__':
 
-    #Define yaml config file and load it here    
-    yaml_config = '/mnt/drive/RabbitMQ/lemma_corpus/prod_config.yml'
-    config = load_config(yaml_config)
-    if config:
-        set_config_vars(config)
-        start_consuming()
+    #Define yaml config file, the prod_config.yml next to this script unless --config is given
+    yaml_config = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'prod_config.yml')
+    main(TASK, yaml_config)
@@ -1,67 +1,14 @@
-import pika
-import json
-import yaml
-from spellchecker import SpellChecker
-from compound_split import char_split
+import os
+import sys
 from nltk import jaccard_distance
 
-QUEUE_NAME = None
-BATCH_SIZE = None
-RABBITMQ_HOST = None
-RABBITMQ_PORT = None
-RABBITMQ_USER = None
-RABBITMQ_PASS = None
-OUTPUT_FOLDER = ''
-
-#Loading PySpellChecker with German corpus to detect Incorrect Words
-spell = SpellChecker(language=['en', 'de'])
-spell.word_frequency.load_text_file('/mnt/drive/RabbitMQ/removeDictionaryWords4/wordlist-german.txt')
-
-def load_config(filename):
-    try:
-        with open(filename, 'r') as file:
-            config = yaml.safe_load(file)
-    except FileNotFoundError:
-        print(f"Could not find {filename}.")
-        return {}
-
-    return config
-
-def set_config_vars(config):
-    global QUEUE_NAME, BATCH_SIZE, RABBITMQ_HOST, RABBITMQ_PORT, RABBITMQ_USER, RABBITMQ_PASS, OUTPUT_FOLDER
-    QUEUE_NAME = config.get('QUEUE_NAME', QUEUE_NAME)
-    BATCH_SIZE = config.get('BATCH_SIZE', BATCH_SIZE)
-    RABBITMQ_HOST = config.get('RABBITMQ_HOST', RABBITMQ_HOST)
-    RABBITMQ_PORT = config.get('RABBITMQ_PORT', RABBITMQ_PORT)
-    RABBITMQ_USER = config.get('RABBITMQ_USER', RABBITMQ_USER)
-    RABBITMQ_PASS = config.get('RABBITMQ_PASS', RABBITMQ_PASS)
-    OUTPUT_FOLDER = config.get('OUTPUT_FOLDER', OUTPUT_FOLDER)
-
-def connect_to_queue():
-    # Establish connection to RabbitMQ server
-    credentials = pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASS)
-    connection = pika.BlockingConnection(pika.ConnectionParameters(
-        host=RABBITMQ_HOST, port=RABBITMQ_PORT, credentials=credentials, heartbeat=7200, socket_timeout=7200))
-
-    channel = connection.channel()
-    # Create a queue for receiving tasks from distributor
-    channel.queue_declare(queue=QUEUE_NAME, durable=True)
-
-    return channel
-
-# Define the callback function to handle incoming messages
-def callback(ch, method, properties, body):
-    # Decode the JSON object from the message body
-    task = json.loads(body.decode('utf-8'))
-    filename = task['filename']
-    contents = task['contents']
-
-    # Print the task to the console
-    """WRITE YOUR TASK HERE OR REFER IT FROM ANOTHER FILE
-    As an example the code is just priting the filename
-	"""
-    print(f"Received task {filename} from distributor")
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.cache import TokenCache
+from common.consumer import ConsumerTask, main
+from common.dictionary import WordChecker, dictionary_version, load_spell_checker
+from common.sinks import DiagnosticsLog
 
+def remove_dictionary_words(filename, contents, checks):
     contents = contents.split(' ')
     
     #List of cleaned words
@@ -72,20 +19,16 @@ def callback(ch, method, properties, body):
     #Removing the duplicate topics
     contents = list(set(contents))
         
-    #Iterating over all the words and validating
+    #Iterating over all the words and validating them with their dictionary checks
     for word in contents:
-        word_to_check = word.strip()
+        word_to_check, compound, _, _, dict_word, known_neighbour = checks[word.strip()]
         
-        #Checking if the word is a compound word and if it is than extracting the split with the highest probabilty
-        compound_word_prob = char_split.split_compound(word_to_check)
-        if (len(compound_word_prob) > 1) and (compound_word_prob[0][0] > 0):
-            word_to_check = compound_word_prob[0][1]
+        #Checking if the word is a compound word, then its first part of the split with the highest probabilty is checked
+        if compound:
             #print('Compound word found:\n{}'.format(word))
             dict_desc += '\nCompound Word Found: \n{}'.format(word)
             
         #Checking for the garbage words which are not part of the dictionary
-        dict_word = spell.correction(word_to_check)
-
         if dict_word == None:
             dict_desc += '\nNoneType found for the word: {}'.format(word_to_check)
             continue
@@ -93,44 +36,64 @@ def callback(ch, method, properties, body):
         dict_desc += 'Original Word: {} \tDictionary Word: {} \tJaccard similarity: {}\n'.format(
                 word, dict_word, jaccard_distance(set(dict_word), set(word_to_check)))
 
-        if (dict_word == word_to_check) and (not spell.known(spell.edit_distance_1(word_to_check))):
+        if (dict_word == word_to_check) and (not known_neighbour):
             print('Incorrect word found: {}'.format(word_to_check))
             dict_desc += '\nIncorrect word found: {}'.format(word_to_check)
             continue
         
         #Checking how far is the dictionary word from the original word using Jaccard Distance
         if (dict_word == word_to_check) or (jaccard_distance(set(dict_word), set(word_to_check)) < 0.2):
-            final_words.append(word.strip() if ((len(compound_word_prob) > 1) and (compound_word_prob[0][0] > 0)) else dict_word)
-            dict_desc += '\nAppending the word: {}'.format(word.strip() if ((len(compound_word_prob) > 1) and (compound_word_prob[0][0] > 0)) else dict_word)
+            final_words.append(word.strip() if compound else dict_word)
+            dict_desc += '\nAppending the word: {}'.format(word.strip() if compound else dict_word)
         
     contents = ' '.join(list(set(final_words)))
     print('Appending Content: {}\n\n'.format(contents))
 
-    #Writing the validation results for each topic in a separate file
-    with open('/mnt/drive/RabbitMQ/removeDictionaryWordsCorpus/file_stat.txt', 'a+', encoding='utf-8') as file:
-        file.writelines(dict_desc)
+    return contents, dict_desc
+
+
+class RemoveDictionaryWordsTask(ConsumerTask):
+    """Keeps the words of a document that the spell checker accepts or can correct."""
+
+    def setup(self):
+        #Loading PySpellChecker with German corpus to detect Incorrect Words, or its delete index with SPELL_BACKEND: symspell
+        backend = self.config.get('SPELL_BACKEND', 'pyspellchecker')
+        self.spell = load_spell_checker(self.config['WORDLIST_FILE'], backend, self.config.get('SPELL_INDEX'))
+        self.dictionary_version = dictionary_version(self.config['WORDLIST_FILE'], backend)
+        #Every distinct word is checked once per dictionary version, the checks are shared through WORD_CACHE_FILE
+        self.word_cache = None
+        if self.config.get('WORD_CACHE_SIZE'):
+            self.word_cache = TokenCache(self.config['WORD_CACHE_SIZE'], self.config.get('WORD_CACHE_FILE'),
+                                         self.config.get('WORD_CACHE_FILE_SIZE', 10000000))
+        self.checker = WordChecker(self.spell, self.dictionary_version, self.word_cache)
+        #Validation results go to a file of every process, file_stat.txt.<host>-<pid>
+        self.stat_file = DiagnosticsLog(self.config['STAT_FILE'])
+
+    def result_version(self):
+        return '{} {}'.format(super().result_version(), self.dictionary_version)
+
+    def cache_lookups(self):
+        if self.word_cache is None:
+            return {}
+        return {('word', result): count for result, count in self.word_cache.take_lookups().items()}
+
+    def process_batch(self, tasks):
+        #Checking the distinct words of the whole batch at once
+        checks = self.checker.check_words(word.strip() for task in tasks for word in task['contents'].split(' '))
+        results = [remove_dictionary_words(task['filename'], task['contents'], checks) for task in tasks]
 
-    # Save the contents to a file with the specified filename
-    with open(OUTPUT_FOLDER + filename, 'w') as file:
-        file.write(contents)
+        #Writing the validation results of the whole batch at once
+        self.stat_file.write(''.join(dict_desc for _, dict_desc in results))
+        #The batch is acknowledged after this, a stopped consumer must not lose its lines
+        self.stat_file.flush()
 
-    # Acknowledge the message to remove it from the queue
-    ch.basic_ack(delivery_tag=method.delivery_tag)
+        return [contents for contents, _ in results]
 
-def start_consuming():
-    # Start consuming messages from the queue
-    channel = connect_to_queue()
-    channel.basic_qos(prefetch_count=1)
-    channel.basic_consume(queue=QUEUE_NAME, on_message_callback=callback)
 
-    print('Waiting for tasks...')
-    channel.start_consuming()
+TASK = RemoveDictionaryWordsTask
 
 if __name__ == '__main__':
 
-    #Define yaml config file and load it here    
-    yaml_config = '/mnt/drive/RabbitMQ/removeDictionaryWordsCorpus/prod_config.yml'
-    config = load_config(yaml_config)
-    if config:
-        set_config_vars(config)
-        start_consuming()
+    #Define yaml config file, the prod_config.yml next to this script unless --config is given
+    yaml_config = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'prod_config.yml')
+    main(TASK, yaml_config)
@@ -0,0 +1,27 @@
+"""
+Serve the queues of several apps from one process.
+
+The tasks of all apps are set up once and share one worker pool, so e.g. the three keyphrase
+apps or several lemma queues do not each keep their own copy of the models in memory.
+All apps have to use the same RabbitMQ server.
+
+Usage:
+python3 serve.py [--workers N] <app folder> [<app folder> ...]
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from common.consumer import load_app, serve
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('apps', nargs='+', help='app folders with a consumer.py and a prod_config.yml')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of worker processes sharing the loaded terminology and models')
+    args = parser.parse_args()
+
+    serve([load_app(os.path.abspath(app)) for app in args.apps], args.workers)
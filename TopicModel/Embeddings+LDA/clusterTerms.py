@@ -0,0 +1,98 @@
+"""Importing Libraries"""
+import numpy as np
+
+class ClusterTerms:
+    """
+    The words of a document grouped by their cluster. Every distinct word is mapped to an integer id once and the
+    counts of the words in the clusters are kept as a sparse cluster x term matrix (the non-zero entries with their
+    cluster, term and count), from which the most frequent and the C-TF-IDF top word of every cluster are found with
+    NumPy operations. Of equally scored words the one which occurs first in the cluster is chosen, like the Counter
+    which was used before.
+    """
+
+    def __init__(self, words, assigned, num_clusters):
+        """
+        Parameters
+        ----------
+        words : List
+            The words of the document.
+        assigned : List
+            The cluster assigned to each word.
+        num_clusters : Int
+            The number of clusters.
+        """
+        self.words = words
+        self.num_clusters = num_clusters
+        assigned = np.asarray(assigned, dtype=np.int64)
+
+        #Positions of the words grouped by cluster, in the order of the document
+        self.order = np.argsort(assigned, kind='stable')
+        self.bounds = np.searchsorted(assigned[self.order], np.arange(num_clusters + 1))
+
+        #Mapping each word to the id of the term
+        term_index = {}
+        term_ids = np.fromiter((term_index.setdefault(word, len(term_index)) for word in words), dtype=np.int64,
+                               count=len(words))
+        self.terms = list(term_index)
+
+        #Counting the terms of each cluster, empty words do not count as they disappear when the cluster text is split
+        counted = np.fromiter((bool(word) for word in words), dtype=bool, count=len(words))
+        counted &= (assigned >= 0) & (assigned < num_clusters)
+        keys = assigned[counted] * max(len(self.terms), 1) + term_ids[counted]
+        keys, self.first, self.count = np.unique(keys, return_index=True, return_counts=True)
+        self.cluster = keys // max(len(self.terms), 1)
+        self.term = keys % max(len(self.terms), 1)
+        self.cluster_size = np.bincount(self.cluster, weights=self.count, minlength=num_clusters)
+
+    @classmethod
+    def from_docstring(cls, docstring):
+        """
+        This function builds the cluster terms from the text of each cluster, as returned by seperate_clusterwords.
+        """
+        words = []
+        assigned = []
+        for cluster, word_cluster in enumerate(docstring):
+            cluster_words = word_cluster.strip().split()
+            words.extend(cluster_words)
+            assigned.extend([cluster] * len(cluster_words))
+        return cls(words, assigned, len(docstring))
+
+    def docstring(self):
+        """
+        This function returns the text of each cluster: its words in the order of the document, each preceded by a
+        space.
+        """
+        return [''.join(' ' + self.words[i] for i in self.order[self.bounds[j]:self.bounds[j + 1]])
+                for j in range(self.num_clusters)]
+
+    def top_terms(self, scores, valid):
+        """
+        This function returns the term with the highest score of each cluster, among the valid entries of the
+        cluster x term matrix, as a dictionary from the cluster to the term.
+        """
+        order = np.lexsort((self.first, -scores, self.cluster))
+        order = order[valid[order]]
+        clusters, index = np.unique(self.cluster[order], return_index=True)
+        return {cluster: self.terms[self.term[order[i]]] for cluster, i in zip(clusters.tolist(), index.tolist())}
+
+    def most_frequent(self):
+        """
+        This function returns the most frequent word of each cluster.
+        """
+        top = self.top_terms(self.count, np.ones(len(self.count), dtype=bool))
+        missing = [cluster for cluster in range(self.num_clusters) if cluster not in top]
+        if missing:
+            raise IndexError('No words in the clusters {}'.format(missing))
+        return [top[cluster] for cluster in range(self.num_clusters)]
+
+    def c_tf_idf(self, idf):
+        """
+        This function returns the word with the highest C-TF-IDF of each cluster: the frequency of the word in the
+        cluster times its inverse document frequency in the corpus. Words without an inverse document frequency are
+        left out, clusters without a word with a positive C-TF-IDF get ''.
+        """
+        term_idf = np.array([idf.get(term, np.nan) for term in self.terms], dtype=np.float64)
+        with np.errstate(invalid='ignore'):
+            scores = (self.count / self.cluster_size[self.cluster]) * term_idf[self.term]
+            top = self.top_terms(scores, scores > 0)
+        return [top.get(cluster, '') for cluster in range(self.num_clusters)]
@@ -1,5 +1,6 @@
 """Importing Libraries"""
 import os
+import sys
 from string import punctuation
 from langdetect import detect
 import re
@@ -10,19 +11,26 @@ from nltk.tokenize import word_tokenize
 from nltk.stem.wordnet import WordNetLemmatizer
 import spacy
 
+### Language index of the metadata, shared with the RabbitMQ apps ###
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'RabbitMQ'))
+from common.languages import LanguageIndex
+
 
 class PreprocessingDocuments():
     """Preprocessing Document class perform several pre processing steps to clean the textual data
     and make it ready to feed data to the model."""
 
-    def __init__(self, basepath):
+    def __init__(self, basepath, language_index=''):
         """Set up directory path which contain full extracted text of documents.
 
         Parameters:
         basepath (string): folder path which contain full extracted text of documents
+        language_index (string): language index of the metadata (RabbitMQ/common/languages.py), the language
+                                 of documents that are not in it is detected from the text
        """
 
         self.basepath = basepath
+        self.languages = LanguageIndex(language_index) if language_index else None
 
         ###Lemmatize using WordNet's built-in morphy function. Returns the input word unchanged if it cannot be found in WordNet.
         #self.lemmatizer = WordNetLemmatizer()
@@ -53,8 +61,27 @@ class PreprocessingDocuments():
         tokenData = self.preProcessing(data)  # preprocess the text
         documentToken.append(tokenData)
         documentToken.append(doc_name)
-        documentToken.append(detect(data))
+        documentToken.append(self.documentLanguage(doc_name, data))
         return documentToken
+
+    def documentLanguage(self, doc_name, data):
+        """Function that returns the language of the document from the language index, or detects it from the text
+
+        Parameters:
+        doc_name (String): name of the document, its PPN followed by the extension
+        data (String): text of the document
+
+        Returns:
+        String: language code of the document
+       """
+        if self.languages is not None:
+            try:
+                language = self.languages[os.path.splitext(doc_name)[0]]
+                if language:
+                    return language
+            except KeyError:
+                pass
+        return detect(data)
     
     def removeUnnecessaryWords(self, filedata):
         """Function to remove the Unnecessary words like Proper Nouns, Adjective etc. 
@@ -0,0 +1,161 @@
+"""Importing Libraries"""
+import hashlib
+import os
+import sqlite3
+import time
+import numpy as np
+
+class EmbeddingCache:
+    """
+    On-disk cache of the word embeddings of documents, so that runs which only change the clustering or the LDA
+    parameters do not transform the documents again.
+
+    The embeddings are keyed by the hash of the document tokens, the name of the model and the hidden state used, and
+    stored as float16 in .npy shards of several documents, which are read memory-mapped. A SQLite index in the cache
+    directory maps each document to its rows in a shard. Documents are collected in memory until a shard is full, so
+    flush has to be called at the end of a run. When the shards exceed the size of the cache, the least recently used
+    shards are deleted.
+    """
+
+    def __init__(self, directory, max_size=20000, shard_size=256):
+        """
+        Parameters
+        ----------
+        directory : String
+            The folder of the shards and the index.
+        max_size : Int, optional
+            The maximum size of the shards in MB. The default is 20000.
+        shard_size : Int, optional
+            The size in MB from which the collected documents are written as a shard. The default is 256.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_size = max_size * 1024 * 1024
+        self.shard_size = shard_size * 1024 * 1024
+        self.pending = {}
+        self.pending_size = 0
+        self.shards = {}
+        self.connection = sqlite3.connect(os.path.join(directory, 'index.sqlite'))
+        self.connection.execute('CREATE TABLE IF NOT EXISTS shards (shard INTEGER PRIMARY KEY, file TEXT, size INTEGER, '
+                                'used REAL)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS documents (content_hash TEXT, model TEXT, layer INTEGER, '
+                                'shard INTEGER, start INTEGER, rows INTEGER, PRIMARY KEY (content_hash, model, layer))')
+        self.connection.commit()
+
+    def content_hash(self, tokens):
+        """
+        This function returns the hash of the tokens of a document.
+        """
+        return hashlib.sha256('\n'.join(tokens).encode('utf-8')).hexdigest()
+
+    def get(self, tokens, model, layer):
+        """
+        This function returns the cached embeddings of the tokens of a document.
+
+        Parameters
+        ----------
+        tokens : List
+            The tokens of the document.
+        model : String
+            The name of the model, e.g. bert-base-multilingual-uncased.
+        layer : Int
+            The hidden state of the embeddings.
+
+        Returns
+        -------
+        embeddings : Array
+            The float16 embeddings, one row per token, None if the document is not cached.
+        """
+        key = (self.content_hash(tokens), model, layer)
+        if key in self.pending:
+            return self.pending[key]
+        row = self.connection.execute('SELECT d.shard, s.file, d.start, d.rows FROM documents d JOIN shards s '
+                                      'ON s.shard = d.shard WHERE d.content_hash = ? AND d.model = ? AND d.layer = ?',
+                                      key).fetchone()
+        if row is None:
+            return None
+        shard, file, start, rows = row
+        if shard not in self.shards:
+            try:
+                self.shards[shard] = np.load(os.path.join(self.directory, file), mmap_mode='r')
+            except (OSError, ValueError):
+                return None
+        self.connection.execute('UPDATE shards SET used = ? WHERE shard = ?', (time.time(), shard))
+        self.connection.commit()
+        return self.shards[shard][start:start + rows]
+
+    def put(self, tokens, model, layer, embeddings):
+        """
+        This function adds the embeddings of the tokens of a document to the cache.
+
+        Parameters
+        ----------
+        tokens : List
+            The tokens of the document.
+        model : String
+            The name of the model.
+        layer : Int
+            The hidden state of the embeddings.
+        embeddings : Array
+            The embeddings, one row per token.
+
+        Returns
+        -------
+        embeddings : Array
+            The embeddings as they are cached, in float16.
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float16)
+        key = (self.content_hash(tokens), model, layer)
+        if key not in self.pending:
+            self.pending[key] = embeddings
+            self.pending_size += embeddings.nbytes
+            if self.pending_size >= self.shard_size:
+                self.flush()
+        return embeddings
+
+    def flush(self):
+        """
+        This function writes the collected documents as a new shard and evicts the least recently used shards if
+        the cache has become too large.
+        """
+        if not self.pending:
+            return
+        shard = self.connection.execute('INSERT INTO shards (file, size, used) VALUES (NULL, 0, ?)',
+                                        (time.time(),)).lastrowid
+        file = '{:08d}.npy'.format(shard)
+        documents = []
+        start = 0
+        for (content_hash, model, layer), embeddings in self.pending.items():
+            documents.append((content_hash, model, layer, shard, start, len(embeddings)))
+            start += len(embeddings)
+        data = np.concatenate(list(self.pending.values()))
+        temp_file = os.path.join(self.directory, file + '.tmp')
+        with open(temp_file, 'wb') as f:
+            np.save(f, data)
+        os.replace(temp_file, os.path.join(self.directory, file))
+
+        self.connection.execute('UPDATE shards SET file = ?, size = ? WHERE shard = ?',
+                                (file, os.path.getsize(os.path.join(self.directory, file)), shard))
+        self.connection.executemany('INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?)', documents)
+        self.connection.commit()
+        self.pending = {}
+        self.pending_size = 0
+        self.evict(keep=shard)
+
+    def evict(self, keep=None):
+        """
+        This function deletes the least recently used shards, except keep, until the cache fits into its size.
+        """
+        total_size = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM shards').fetchone()[0]
+        for shard, file, size in self.connection.execute('SELECT shard, file, size FROM shards ORDER BY used').fetchall():
+            if total_size <= self.max_size:
+                break
+            if shard == keep:
+                continue
+            self.connection.execute('DELETE FROM documents WHERE shard = ?', (shard,))
+            self.connection.execute('DELETE FROM shards WHERE shard = ?', (shard,))
+            self.connection.commit()
+            self.shards.pop(shard, None)
+            if file and os.path.exists(os.path.join(self.directory, file)):
+                os.remove(os.path.join(self.directory, file))
+            total_size -= size
@@ -0,0 +1,121 @@
+"""Importing Libraries"""
+import numpy as np
+
+class SphericalKMeans:
+    """
+    K-means clustering of word embeddings by cosine similarity, computed with NumPy for all the vectors, centroids
+    and restarts at once. The vectors and centroids are normalized to length 1, so that the cosine similarity is a
+    dot product, every restart is seeded with k-means++ and stops as soon as its cluster memberships stabilise
+    """
+
+    def __init__(self, num_means, repeats=25, max_iterations=100, avoid_empty_clusters=True, seed=123):
+        """
+        Parameters
+        ----------
+        num_means : Int
+            The number of clusters to make.
+        repeats : Int, optional
+            The number of restarts, the one with the highest total similarity of the vectors to their centroids is kept.
+            The default is 25.
+        max_iterations : Int, optional
+            The maximum number of iterations of a restart. The default is 100.
+        avoid_empty_clusters : Boolean, optional
+            Include the current centroid in the computation of the next one, so that a cluster which becomes empty
+            keeps its centroid. The default is True.
+        seed : Int, optional
+            Seed of the random number generator, to make the results consistent when the clustering is performed
+            again. The default is 123.
+        """
+        self.num_means = num_means
+        self.repeats = repeats
+        self.max_iterations = max_iterations
+        self.avoid_empty_clusters = avoid_empty_clusters
+        self.seed = seed
+
+    def normalize(self, vectors):
+        """
+        This function scales the vectors (along the last axis) to length 1, vectors of length 0 are kept.
+        """
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.where(norms > 0, norms, 1)
+
+    def initial_means(self, vectors, rng):
+        """
+        This function chooses the initial centroids of every restart with k-means++: the first one at random, every
+        next one with a probability proportional to the squared cosine distance to the closest centroid chosen so far.
+
+        Parameters
+        ----------
+        vectors : Array
+            The normalized vectors, one row per vector.
+        rng : Generator
+            The seeded random number generator.
+
+        Returns
+        -------
+        means : Array
+            The initial centroids, restarts x clusters x dimensions.
+        """
+        restarts = np.arange(self.repeats)
+        chosen = np.empty((self.repeats, self.num_means), dtype=np.int64)
+        chosen[:, 0] = rng.integers(len(vectors), size=self.repeats)
+        closest = np.full((self.repeats, len(vectors)), np.inf)
+        for j in range(1, self.num_means):
+            distances = 1 - vectors[chosen[:, j - 1]] @ vectors.T
+            closest = np.minimum(closest, np.maximum(distances, 0) ** 2)
+            weights = closest.cumsum(axis=1)
+
+            #Vectors which are all identical to the chosen ones are chosen uniformly
+            totals = weights[:, -1]
+            uniform = totals <= 0
+            weights[uniform] = np.arange(1, len(vectors) + 1)
+            totals = weights[:, -1]
+
+            draws = rng.random(self.repeats) * totals
+            chosen[:, j] = np.minimum((weights <= draws[:, None]).sum(axis=1), len(vectors) - 1)
+            closest[restarts, chosen[:, j]] = 0
+        return vectors[chosen]
+
+    def cluster(self, vectors):
+        """
+        This function clusters the vectors and returns the cluster of every vector.
+
+        Parameters
+        ----------
+        vectors : Array
+            The vectors to cluster, one row per vector.
+
+        Returns
+        -------
+        assigned : List
+            The index of the cluster assigned to each vector.
+        """
+        vectors = self.normalize(np.asarray(vectors, dtype=np.float64))
+        if len(vectors) <= self.num_means:
+            return list(range(len(vectors)))
+
+        rng = np.random.default_rng(self.seed)
+        means = self.initial_means(vectors, rng)
+        clusters = np.arange(self.num_means)
+        assigned = None
+        for iteration in range(self.max_iterations):
+            #Similarity of every vector to every centroid of every restart, restarts x vectors x clusters
+            similarities = np.matmul(vectors, means.transpose(0, 2, 1))
+            new_assigned = similarities.argmax(axis=2)
+            if assigned is not None and np.array_equal(new_assigned, assigned):
+                break
+            assigned = new_assigned
+
+            #Recalculating the centroids as the normalized sum of the vectors of each cluster
+            memberships = (assigned[:, :, None] == clusters).astype(np.float64)
+            sums = np.matmul(memberships.transpose(0, 2, 1), vectors)
+            if self.avoid_empty_clusters:
+                sums += means
+            means = self.normalize(sums)
+        else:
+            similarities = np.matmul(vectors, means.transpose(0, 2, 1))
+            assigned = similarities.argmax(axis=2)
+
+        #Keeping the restart in which the vectors are closest to their centroids
+        scores = np.take_along_axis(similarities, assigned[:, :, None], axis=2).sum(axis=(1, 2))
+        return assigned[scores.argmax()].tolist()
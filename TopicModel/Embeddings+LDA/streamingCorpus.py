@@ -0,0 +1,80 @@
+"""Importing Libraries"""
+import json
+import gensim.corpora as corpora
+
+class StreamingCorpus:
+    """
+    The tokens of the documents of the LDA corpus, kept on disk instead of in memory. The tokens of each document are
+    written to a text file as soon as the document is preprocessed, one JSON list of tokens per line, so that tokens
+    with spaces or line breaks come back unchanged, and read back as a stream whenever the corpus is iterated. The bag of words of the documents is serialized once
+    into a Matrix Market file, which gensim reads document by document as well.
+    """
+
+    def __init__(self, path):
+        """
+        Parameters
+        ----------
+        path : String
+            The path of the corpus files without extension: <path>.tokens.txt, <path>.mm and <path>.dict.
+        """
+        self.path = path
+        self.tokens_file = path + '.tokens.txt'
+        self.file = open(self.tokens_file, 'w', encoding='utf-8')
+        self.number_of_documents = 0
+
+    def add(self, tokens):
+        """
+        This function appends the tokens of a document to the corpus.
+        """
+        self.file.write(json.dumps(tokens))
+        self.file.write('\n')
+        self.number_of_documents += 1
+
+    def close(self):
+        """
+        This function finishes writing the corpus.
+        """
+        if not self.file.closed:
+            self.file.close()
+
+    def __len__(self):
+        return self.number_of_documents
+
+    def __iter__(self):
+        """
+        This function streams the tokens of the documents from the tokens file.
+        """
+        self.close()
+        with open(self.tokens_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line)
+
+    def dictionary(self):
+        """
+        This function builds the dictionary of the corpus in one pass over the tokens and saves it to <path>.dict.
+
+        Returns
+        -------
+        id2word : Dictionary
+            The dictionary of the corpus.
+        """
+        id2word = corpora.Dictionary(self)
+        id2word.save(self.path + '.dict')
+        return id2word
+
+    def bag_of_words(self, id2word):
+        """
+        This function serializes the bag of words of the documents into <path>.mm.
+
+        Parameters
+        ----------
+        id2word : Dictionary
+            The dictionary of the corpus.
+
+        Returns
+        -------
+        corpus : MmCorpus
+            The bag of words of the documents, streamed from the Matrix Market file.
+        """
+        corpora.MmCorpus.serialize(self.path + '.mm', (id2word.doc2bow(tokens) for tokens in self), id2word=id2word)
+        return corpora.MmCorpus(self.path + '.mm')
@@ -4,21 +4,27 @@ import time
 import re
 import yaml
 import os
+import sys
 import csv
 import torch
 import itertools
 import numpy as np
-import random
-from collections import Counter
 
 import gensim.corpora as corpora
 from gensim.models.coherencemodel import CoherenceModel
 from gensim.models.ldamodel import LdaModel
-from nltk.cluster.util import cosine_distance
-from nltk.cluster import KMeansClusterer
+from gensim.models.ldamulticore import LdaMulticore
 
 from transformers import *
 from dataPreprocessing import *
+from sphericalKMeans import SphericalKMeans
+from embeddingCache import EmbeddingCache
+from clusterTerms import ClusterTerms
+from streamingCorpus import StreamingCorpus
+
+### Document frequencies of the corpus, shared with the RabbitMQ keyphrase apps ###
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'RabbitMQ'))
+from common.corpusstats import CorpusStats, update_corpus_stats
 
 class TopicModelling:
     """TopicModelling class transform preprocessed textual tokens of document into embeddings, perform k-means clustering
@@ -44,6 +50,8 @@ class TopicModelling:
         self.lemmatizer = WordNetLemmatizer()
         self.idf = {}                             #Inverse Document Frequency for TF-IDF
         self.lda_model = None
+        self.encoder_model = None                 #self.model without the layers the clustering does not use
+        self.prepared_model = None
         
         #Reading the Configuration file
         with open('Config.yaml', 'r') as cfg_file:
@@ -55,38 +63,45 @@ class TopicModelling:
             self.word_embedding_LDA = cfg['lda']['mode']['word_embedding_LDA']
             self.save_model = cfg['lda']['save_model']
             self.load_model = cfg['lda']['load_model']
+            self.language_index = cfg['lda'].get('language_index', '')
+            #Hidden state clustered (0 is the output of the embedding layer), chunks of 512 tokens per forward pass
+            #and CPU threads of torch (0 keeps the torch default)
+            self.embedding_layer = cfg['lda'].get('embedding_layer', 0)
+            self.embedding_batch_size = cfg['lda'].get('embedding_batch_size', 8)
+            torch_threads = cfg['lda'].get('torch_threads', 0)
+            torch_interop_threads = cfg['lda'].get('torch_interop_threads', 0)
+            #Restarts of the k-means clustering and maximum iterations of each restart
+            self.kmeans_repeats = cfg['lda'].get('kmeans_repeats', 25)
+            self.kmeans_max_iterations = cfg['lda'].get('kmeans_max_iterations', 100)
+            #Folder and size in MB of the cache of the word embeddings of the documents, '' to transform every document
+            embedding_cache = cfg['lda'].get('embedding_cache', '')
+            embedding_cache_size = cfg['lda'].get('embedding_cache_size', 20000)
+            #Document frequencies of the corpus (RabbitMQ/common/corpusstats.py), updated with the new and changed documents
+            self.corpus_stats = cfg['lda'].get('corpus_stats') or self.output_directory + 'corpus_stats.sqlite'
+            self.corpus_stats_workers = cfg['lda'].get('corpus_stats_workers', 1)
+            #Worker processes training the LDA model, 1 trains it in this process with LdaModel
+            self.lda_workers = cfg['lda'].get('lda_workers', 1)
             
         assert sum([self.word_embedding_only, self.LDA_only, self.word_embedding_LDA]) == 1, 'Only ONE Approach can be applied at a time'
         
+        self.embedding_cache = EmbeddingCache(embedding_cache, embedding_cache_size) if embedding_cache else None
+        
+        if torch_threads:
+            torch.set_num_threads(torch_threads)
+        if torch_interop_threads:
+            torch.set_num_interop_threads(torch_interop_threads)
+        
         print('Doing Topic Modelling using the Approach: {}'.format(
               'Word Embedding Only' if self.word_embedding_only else 'LDA Only' if self.LDA_only else 'Word Embedding and LDA'))
         
         if self.word_embedding_only:
             print('Calculating the Inverse Document Frequency for the whole Corpus')
             
-            #Listing and Preprocessing the documents
-            preprocessed_docs = PreprocessingDocuments(basepath=self.input_directory)
-            documents_list = preprocessed_docs.listAllDocs()
-            
-            for document in documents_list:
-                try:
-                    #Preprocessing the document text
-                    doctokens = preprocessed_docs.tokenArray(document)[0]
-                    
-                    #Removing duplicate words
-                    doctokens = list(set(doctokens))
-                    
-                    #Updating word counts for the whole corpus
-                    for word in doctokens:
-                        if word in self.idf.keys():
-                            self.idf[word] += 1
-                        else:
-                            self.idf[word] = 1
-                except Exception as e:
-                    pass
+            #Only the documents that are new or changed since the last run are tokenized
+            update_corpus_stats(self.input_directory, self.corpus_stats, self.corpus_stats_workers)
             
             #Calculating Inverse Document Frequency (IDF) for each word
-            self.idf = {key: np.log(len(documents_list) / value) for key, value in self.idf.items()}
+            self.idf = CorpusStats(self.corpus_stats).idf()
             
     def set_model_type_multilingual_bert(self):
         """Function that set up specific configurations in order to transform preprocessed textual tokens into word embeddings
@@ -123,37 +138,66 @@ class TopicModelling:
         self.model = AutoModelForMaskedLM.from_pretrained("uklfr/gottbert-base", output_hidden_states=True)
         self.fileName = "germanResultstest_GottBert.csv"
 
+    def prepare_model(self):
+        """Function that puts the embeddings model into inference mode and keeps only what the clustering uses: the
+        base model without its language model head, and of its encoder only the layers below embedding_layer
+
+        Returns:
+        model: return the base model of self.model
+        """
+        if self.prepared_model is not self.model:
+            self.model.eval()
+            self.encoder_model = self.model.base_model
+            self.encoder_model.encoder.layer = self.encoder_model.encoder.layer[:self.embedding_layer]
+            self.prepared_model = self.model
+        return self.encoder_model
+
     def transform_tokens_to_embeddings(self, dArrary):
         """Function that read the preprocessed textual tokens, convert the tokens into batch of 512 tokens, transform the
-        tokens into word embeddings and finally concatenated all the word embeddings together
+        tokens into word embeddings and finally concatenated all the word embeddings together. embedding_batch_size
+        chunks are padded to the longest of them and transformed in one forward pass. With an embedding cache the
+        embeddings of a document are only computed once per model and embedding_layer
 
         Parameters:
         dArrary (List): list of preprocessed textual tokens
 
         Returns:
-        batch_input (List): return words embeddings of the preprocessed textual tokens
+        batch_input (Array): return words embeddings of the preprocessed textual tokens, one row per token
         wordtoken (list): return preprocessed textual tokens
 
         """
         data = dArrary[0]
+        wordtoken = [[num.strip() for num in data_chunk] for data_chunk in self.batch(data, 512)]
+        
+        if self.embedding_cache is not None:
+            tokens = list(itertools.chain(*wordtoken))
+            batch_input = self.embedding_cache.get(tokens, self.model.name_or_path, self.embedding_layer)
+            if batch_input is not None:
+                return np.asarray(batch_input, dtype=np.float32), wordtoken
+        
+        model = self.prepare_model()
+        pad_token_id = self.tokenizer.pad_token_id or 0
         total_embeddings = []
-        wordtoken = []
-        for data_chunk in self.batch(data, 512):
-            indexed_tokens = []
-            tokens_stripped = [num.strip() for num in data_chunk]
-            wordtoken.append(tokens_stripped)
-            indexed_tokens = self.tokenizer.convert_tokens_to_ids(tokens_stripped)
-            segments_ids = [1] * len(tokens_stripped)
-            tokens_tensor = torch.tensor([indexed_tokens])
-            segments_tensors = torch.tensor([segments_ids])
-            self.model.eval()
-            with torch.no_grad():
-                outputs = self.model(tokens_tensor, segments_tensors)
-                hidden_states = outputs[1]
-                token_embeddings = torch.stack(hidden_states, dim=0)
-                total_embeddings.append(token_embeddings)
-
-        batch_input = torch.cat(total_embeddings, dim=2)
+        with torch.inference_mode():
+            for chunks in self.batch(wordtoken, self.embedding_batch_size):
+                length = max(len(chunk) for chunk in chunks)
+                tokens_tensor = torch.full((len(chunks), length), pad_token_id, dtype=torch.long)
+                attention_mask = torch.zeros((len(chunks), length), dtype=torch.long)
+                for row, chunk in enumerate(chunks):
+                    tokens_tensor[row, :len(chunk)] = torch.tensor(self.tokenizer.convert_tokens_to_ids(chunk))
+                    attention_mask[row, :len(chunk)] = 1
+                outputs = model(input_ids=tokens_tensor, attention_mask=attention_mask, output_hidden_states=True)
+                hidden_state = outputs.hidden_states[self.embedding_layer]
+                
+                #Dropping the padding again
+                for row, chunk in enumerate(chunks):
+                    total_embeddings.append(hidden_state[row, :len(chunk)])
+
+        batch_input = torch.cat(total_embeddings).numpy()
+        if self.embedding_cache is not None:
+            #Using the cached float16 values also for this run, so that the results do not depend on the cache
+            batch_input = self.embedding_cache.put(tokens, self.model.name_or_path, self.embedding_layer, batch_input)
+            batch_input = batch_input.astype(np.float32)
         return batch_input, wordtoken
 
     def batch(self, iterable, n=1):
@@ -171,22 +215,20 @@ class TopicModelling:
             yield iterable[ndx:min(ndx + n, l)]
 
     def assigned_clusters(self, token_embeddings, NUM_CLUSTERS):
-        """Function that cluster the word embeddings using k-means clustering
+        """Function that cluster the word embeddings using spherical (cosine) k-means clustering
 
         Parameters:
-        token_embeddings (List): list of word embeddings
+        token_embeddings (Array): word embeddings, one row per token
         NUM_CLUSTERS (Int): number of clusters to make from word embeddings
 
         Returns:
         Dictionary: return clustered word embeddings
 
         """
-        rng = random.Random()
-        rng.seed(123) #set specific seed in order to make results consisten when we perform k-means clustering again
-        kclusterer = KMeansClusterer(NUM_CLUSTERS, distance=cosine_distance, repeats=25, avoid_empty_clusters=True,
-                                     rng=rng)
-        n12 = np.squeeze(np.asarray(token_embeddings))
-        assigned_clusters = kclusterer.cluster(n12[0], assign_clusters=True)
+        #set specific seed in order to make results consisten when we perform k-means clustering again
+        kclusterer = SphericalKMeans(NUM_CLUSTERS, repeats=self.kmeans_repeats, max_iterations=self.kmeans_max_iterations,
+                                     avoid_empty_clusters=True, seed=123)
+        assigned_clusters = kclusterer.cluster(token_embeddings)
         return assigned_clusters
 
     def seperate_clusterwords(self, wordtoken, assigned):
@@ -201,61 +243,62 @@ class TopicModelling:
 
         """
 
-        word = list(itertools.chain(*wordtoken))
-        count = 1
-        j = 0
-        doc = []
-        while j < self.NUM_CLUSTERS:
-            idx = [i for i in range(len(assigned)) if assigned[i] == j]
-            words = []
-            j += 1
-            k = 0
-            while k < len(idx):
-                words.append(word[idx[k]])
-                k += 1
-            doc.append(words)
-        docstring = []
-        for key in doc:
-            string = '';
-            for word in key:
-                string = string + ' ' + word
-            docstring.append(string)
-
-        return docstring
-
-    def fit_lda_model(self, docstring):
-        """Function that uses the LDA model to find topic in each cluster of words
+        return self.cluster_terms(wordtoken, assigned).docstring()
+
+    def cluster_terms(self, wordtoken, assigned):
+        """Function that group the words by their assigned cluster and count them
 
         Parameters:
-        docstring (List): list of lists in which each element is list of words assigned to specific cluster
+        word token (List): list of word embeddings
+        assigned (List): list of assigned cluster to specific word embedding
 
         Returns:
+        ClusterTerms: return the words of each cluster and their counts
+        """
+
+        return ClusterTerms(list(itertools.chain(*wordtoken)), assigned, self.NUM_CLUSTERS)
+
+    def fit_lda_model(self, tokenized_words):
+        """Function that uses the LDA model to find topic in each cluster of words. The dictionary and the bag of words
+        of the documents are built while streaming the tokens from disk, so the memory does not grow with the corpus
+
+        Parameters:
+        tokenized_words (StreamingCorpus): tokens of each document
+
+        Returns:
+        corpus: return bag of words of each document, streamed from disk
         topic_words_total: return list of topics found in the document
         coherence_lda: return coherence score of the topics found in the document
         """
 
-        tokenized_words = []
-        
-        for doc in docstring:
-            for text in doc:
-                tokenized_words.append(word_tokenize(text))
-            
         # Create Dictionary
-        id2word = corpora.Dictionary(tokenized_words)
+        id2word = tokenized_words.dictionary()
 
         # Term Document Frequency
-        corpus = [id2word.doc2bow(text) for text in tokenized_words]
-
-        lda_model = LdaModel(corpus=corpus, id2word=id2word,
-                              num_topics=20,
-                              iterations=100,
-                              random_state=100,
-                              update_every=1,
-                              chunksize=100,
-                              passes=10,
-                              alpha=0.3,
-                              per_word_topics=True,
-                              eta=0.31)
+        corpus = tokenized_words.bag_of_words(id2word)
+
+        if self.lda_workers > 1:
+            lda_model = LdaMulticore(corpus=corpus, id2word=id2word,
+                                     workers=self.lda_workers,
+                                     num_topics=20,
+                                     iterations=100,
+                                     random_state=100,
+                                     chunksize=100,
+                                     passes=10,
+                                     alpha=0.3,
+                                     per_word_topics=True,
+                                     eta=0.31)
+        else:
+            lda_model = LdaModel(corpus=corpus, id2word=id2word,
+                                  num_topics=20,
+                                  iterations=100,
+                                  random_state=100,
+                                  update_every=1,
+                                  chunksize=100,
+                                  passes=10,
+                                  alpha=0.3,
+                                  per_word_topics=True,
+                                  eta=0.31)
         
         # Compute Coherence Score
         coherence_model_lda = CoherenceModel(model=lda_model, texts=tokenized_words, dictionary=id2word, coherence='c_v')
@@ -339,7 +382,7 @@ class TopicModelling:
             with open('exception.txt', 'a+') as file:
                 file.write(e.__str__())
                 
-    def topic_word_embeddings_only(self, docstring, use_c_tfidf = False):
+    def topic_word_embeddings_only(self, docstring, use_c_tfidf = False, cluster_terms = None):
         """
         The function takes the clustered text and extracts the topics from each cluster and return it as an output.
 
@@ -349,6 +392,8 @@ class TopicModelling:
             The list containing the text which have been clustered already.
         use_c_tfidf : Boolean
             Whether to use C-TF-IDF for finding the important words in a cluster or not.
+        cluster_terms : ClusterTerms, optional
+            The counted words of the clusters, from cluster_terms. The default is None, to count the words of docstring.
 
         Returns
         -------
@@ -356,39 +401,15 @@ class TopicModelling:
             The list of topics extracted from the clustered text.
         """
         try:
-            #List containing the topics for the current document
-            topics = []
+            if cluster_terms is None:
+                cluster_terms = ClusterTerms.from_docstring(docstring)
             
-            #Iterating over all the word clusters
-            for word_cluster in docstring:
-                words = word_cluster.strip().split()
-                c = Counter(w for w in words)
-                
-                if use_c_tfidf:
-                    
-                    #Initializing variables to store most important word
-                    highest_tfidf, highest_tfidf_word = 0, ''
-                    
-                    #Iterating over all unique words in the cluster
-                    for key, value in c.items():
-                        try:
-                            #Calculating the C-TF-IDF of the word
-                            tf_idf = (value / len(words)) * self.idf[key]
-                            
-                            #Updating the highest C-TF-IDF word
-                            if tf_idf > highest_tfidf:
-                                highest_tfidf = tf_idf
-                                highest_tfidf_word = key
-                        except Exception as e:
-                            pass
-                    
-                    #Appending the word with the highest C-TF-IDF
-                    topics.append(highest_tfidf_word)
-                else:
-                    #Appending the word which is occured the most
-                    topics.append(c.most_common(1)[0][0])
+            if use_c_tfidf:
+                #The word with the highest C-TF-IDF of each cluster
+                return cluster_terms.c_tf_idf(self.idf)
             
-            return topics
+            #The word which is occured the most in each cluster
+            return cluster_terms.most_frequent()
         except Exception as e:
             print(e)
             with open('exception.txt', 'a+') as file:
@@ -439,7 +460,7 @@ class TopicModelling:
         documents_directory_path (String): directory path which contain documents on which topic modelling is to performed
         """
 
-        preprocessed_docs = PreprocessingDocuments(basepath=self.input_directory)
+        preprocessed_docs = PreprocessingDocuments(basepath=self.input_directory, language_index=self.language_index)
         documents_list = preprocessed_docs.listAllDocs()  # return list of all documents
         print("Total Documents", len(documents_list))
         count = 0
@@ -456,8 +477,8 @@ class TopicModelling:
         word_embedding_only_topics = []
         word_embedding_only_doctokens = []
         
-        #Initializing the corpus lda tokens
-        lda_corpus_tokens = []
+        #Initializing the corpus lda tokens, written to disk document by document
+        lda_corpus_tokens = StreamingCorpus(self.output_directory + 'lda_corpus') if not self.word_embedding_only else None
         lda_corpus_doctokens = []
                 
         for document in documents_list:
@@ -482,14 +503,14 @@ class TopicModelling:
                     module_start_time = time.time()
                     assigned = self.assigned_clusters(batch_input,
                                                       self.NUM_CLUSTERS)  # perform k-means clustering on word embeddings
-                    docstring = self.seperate_clusterwords(wordtoken,
-                                                            assigned)  # separate list of words that exist in specfic cluster
+                    cluster_terms = self.cluster_terms(wordtoken, assigned)
+                    docstring = cluster_terms.docstring()  # separate list of words that exist in specfic cluster
                     module_meantime['clustering'] += (time.time() - module_start_time)
                     
                     if self.word_embedding_only:
                         
                         #Extracting the topics
-                        topics = self.topic_word_embeddings_only(docstring, use_c_tfidf=False)
+                        topics = self.topic_word_embeddings_only(docstring, use_c_tfidf=False, cluster_terms=cluster_terms)
                         
                         #Saving the topics and the text for later to calculate the Coherence Score
                         word_embedding_only_docstring.append(docstring)
@@ -502,10 +523,8 @@ class TopicModelling:
                         
                 #Fitting the LDA model
                 if self.LDA_only or self.word_embedding_LDA:
-                    LDA_only_doctokens = [' '.join(doctokens[0])]
-                    
-                    #Appending tokens and document details in a list
-                    lda_corpus_tokens.append(LDA_only_doctokens)
+                    #Appending tokens to the corpus and document details in a list
+                    lda_corpus_tokens.add(doctokens[0])
                     lda_corpus_doctokens.append(doctokens[1:])
                     
                     count = count + 1
@@ -516,6 +535,9 @@ class TopicModelling:
                     file.write(document)
                     file.write('\n')
         
+        if self.embedding_cache is not None:
+            self.embedding_cache.flush()
+        
         if self.word_embedding_only:
             print('\nCalculating the Coherence Scores for each document in Word Embedding Only Mode...\n')
             self.word_embeddings_only_coherence_score(word_embedding_only_docstring, word_embedding_only_topics, word_embedding_only_doctokens)
@@ -1,13 +1,17 @@
 """Importing Libraries"""
 
 from nltk import jaccard_distance
-from spellchecker import SpellChecker
-from compound_split import char_split
 import re
 import csv
 import time
 import yaml
 import os
+import sys
+
+### Dictionary checks of the words, shared with the removeDictionaryWordsCorpus consumer ###
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'RabbitMQ'))
+from common.cache import TokenCache
+from common.dictionary import WordChecker, dictionary_version, load_spell_checker
 
 class ValidateResults():
     """
@@ -21,16 +25,22 @@ class ValidateResults():
         the Pyspellchecker for checking correctness of each words
         """
         
-        #Loading PySpellChecker with German corpus to detect Incorrect Words
-        self.spell = SpellChecker(language=['en', 'de'])
-        self.spell.word_frequency.load_text_file('wordlist-german.txt')
-        
         #Reading the Configuration file and Saving the Input and the Output File Path
         with open('Config.yaml', 'r') as cfg_file:
             cfg = yaml.load(cfg_file, Loader=yaml.FullLoader)
             self.filename = cfg['validation']['lda_filename']
             self.input_filepath = cfg['validation']['input_dir']
             self.output_filepath = cfg['validation']['output_dir']
+            word_cache = cfg['validation'].get('word_cache', '')
+            spell_backend = cfg['validation'].get('spell_backend') or 'pyspellchecker'
+        
+        #Loading PySpellChecker with German corpus to detect Incorrect Words, or its delete index with spell_backend: symspell
+        self.spell = load_spell_checker('wordlist-german.txt', spell_backend)
+        
+        #Every distinct word is checked once per dictionary version, with word_cache the checks are kept in
+        #a file which the removeDictionaryWordsCorpus consumer and common/dictionary.py fill as well
+        self.checker = WordChecker(self.spell, dictionary_version('wordlist-german.txt', spell_backend),
+                                   TokenCache(100000, word_cache) if word_cache else None)
     
     def clean_results(self, topics, document_index):
         """This function cleans the resultant LDA topic in two ways:
@@ -49,30 +59,32 @@ class ValidateResults():
         final_topics = []
         dict_desc = '\nDocument Id: {}\n\n'.format(document_index+1)
         
-        #Iterating over all the topics and validating
+        #Iterating over all the topics and validating them with their dictionary checks
+        checks = self.checker.check_words(topic.strip() for topic in topics)
         for topic in topics:
-            word_to_check = topic.strip()
-            compound_word_prob = char_split.split_compound(word_to_check)
+            word_to_check, compound, split, best_split, dict_word, known_neighbour = checks[topic.strip()]
             
-            #Checking if the word is a compound word and if it is than extracting the split with the
-            #highest probabilty
-            if (len(compound_word_prob) > 1) and (compound_word_prob[0][0] > 0):
-                word_to_check = compound_word_prob[0][1]
-                dict_desc += 'Compound word found:\n{}'.format(compound_word_prob)
+            #Checking if the word is a compound word, then its first part of the split with the
+            #highest probabilty is checked
+            if compound:
+                dict_desc += 'Compound word found:\n{}'.format(best_split)
+            
+            #Checking for the garbage words which are not part of the dictionary
+            if dict_word is None:
+                dict_desc += 'No dictionary word found for: {}\n'.format(topic)
+                continue
             
-            dict_word = self.spell.correction(word_to_check)
             dict_desc += 'Original Word: {}\tDictionary Word: {}\tJaccard similarity: {}\n'.format(
                 topic, dict_word, jaccard_distance(set(dict_word), set(topic)))
             
-            #Checking for the garbage words which are not part of the dictionary
-            if (dict_word == word_to_check) and (not self.spell.known(self.spell.edit_distance_1(word_to_check))):
+            if (dict_word == word_to_check) and (not known_neighbour):
                 dict_desc += 'Incorrect word found: {}'.format(topic)
                 continue
             
             #Checking how far is the dictionary word from the original word using Jaccard Distance
             if (dict_word == word_to_check) or (jaccard_distance(set(dict_word), set(word_to_check)) < 0.2):
-                dict_desc += 'Appending {} to the final list\n'.format(topic.strip() if len(compound_word_prob) > 1 else dict_word)
-                final_topics.append(topic.strip() if len(compound_word_prob) > 1 else dict_word)
+                dict_desc += 'Appending {} to the final list\n'.format(topic.strip() if split else dict_word)
+                final_topics.append(topic.strip() if split else dict_word)
         
         #Writing the validation results for each topic in a separate file
         with open(self.output_filepath + 'file_stat.txt', 'a+', encoding='utf-8') as f: